@@ -0,0 +1,289 @@
+"""
+Local stand-ins for the Trakt API, Newznab indexers and NZBGet's JSON-RPC
+Every server counts requests per endpoint so benchmark runs can report how
+many calls each phase made.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+WATCHED_AT = "2024-01-01T00:00:00.000Z"
+RESOLUTIONS = ("720p", "1080p", "2160p")
+RESOLUTION_SIZES_MB = {"720p": 900, "1080p": 2200, "2160p": 7000}
+NZB = b'<?xml version="1.0" encoding="UTF-8"?>\n<nzb xmlns="http://www.newzbin.com/DTD/2003/nzb"></nzb>\n'
+
+
+def _word(rng):
+    consonants, vowels = "bcdfghjklmnprstvz", "aeiou"
+    return "".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(rng.randint(2, 4))).title()
+
+
+def release_name(title, season, episode, resolution):
+    return f"{title.replace(' ', '.')}.S{season:02}E{episode:02}.{resolution}.WEB-DL-BENCH"
+
+
+class Collection:
+    """
+    A synthetic Trakt collection of shows with one aired season each
+    Half of each season is watched, so the next episodes start mid-season
+    """
+    def __init__(self, shows, episodes, seed=1):
+        self.shows = shows
+        self.episodes = episodes
+        self.watched = episodes // 2
+        # Distinct made-up titles; numbered ones would all look alike to the
+        # fuzzy show matching, unlike a real collection
+        rng = random.Random(seed)
+        self.titles = [None]
+        while len(self.titles) <= shows:
+            title = f"{_word(rng)} {_word(rng)}"
+            if title not in self.titles:
+                self.titles.append(title)
+        self._by_title = {title.lower(): index for index, title in enumerate(self.titles) if title}
+
+    def title(self, index):
+        return self.titles[index]
+
+    def index_for_title(self, title):
+        return self._by_title.get(title.lower())
+
+    def ids(self, index):
+        return {"trakt": index, "slug": f"benchmark-show-{index:04}", "tvdb": 100000 + index,
+                "imdb": f"tt{index:07}", "tmdb": 200000 + index}
+
+    def show(self, index):
+        return {"title": self.title(index), "year": 2000 + index % 25, "ids": self.ids(index)}
+
+    def index_for(self, id_name, value):
+        """Find a show index from a Newznab id parameter"""
+        offsets = {"tvdbid": 100000, "tmdbid": 200000}
+        try:
+            if id_name == "imdbid":
+                index = int(value.lstrip("t"))
+            else:
+                index = int(value) - offsets[id_name]
+        except (KeyError, ValueError):
+            return None
+        return index if 1 <= index <= self.shows else None
+
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, **options):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        for name, value in options.items():
+            setattr(self, name, value)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def count(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] += 1
+
+    def take_counts(self):
+        """Return the counts since the last call and reset them"""
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+        return dict(counts)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TraktHandler(Handler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        collection = self.server.collection
+        endpoint = re.sub(r"/\d+", "/{id}", url.path)
+        self.server.count(endpoint)
+
+        match = re.match(r"^/shows/(\d+)/progress/watched$", url.path)
+        if url.path == "/users/me/collection/shows":
+            data = [{
+                "last_collected_at": WATCHED_AT,
+                "show": collection.show(index),
+                "seasons": [{"number": 1, "episodes": [
+                    {"number": episode, "collected_at": WATCHED_AT}
+                    for episode in range(1, collection.episodes + 1)
+                ]}],
+            } for index in range(1, collection.shows + 1)]
+        elif url.path == "/sync/last_activities":
+            data = {"all": WATCHED_AT, "episodes": {"watched_at": WATCHED_AT, "collected_at": WATCHED_AT}}
+        elif url.path == "/sync/watched/shows":
+            data = [{"last_watched_at": WATCHED_AT, "show": collection.show(index)}
+                    for index in range(1, collection.shows + 1)]
+        elif match and 1 <= int(match.group(1)) <= collection.shows:
+            data = self.progress(int(match.group(1)))
+        else:
+            self.reply(404, b'{"error": "not found"}')
+            return
+
+        body = json.dumps(data).encode()
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.reply(304, headers={"ETag": etag})
+        else:
+            self.reply(200, body, headers={"ETag": etag})
+
+    def progress(self, index):
+        collection = self.server.collection
+
+        def episode(number):
+            return {"season": 1, "number": number, "title": f"Episode {number}",
+                    "ids": {"trakt": index * 1000 + number}}
+
+        return {
+            "aired": collection.episodes,
+            "completed": collection.watched,
+            "seasons": [{"number": 1, "episodes": [
+                {"number": number, "completed": number <= collection.watched}
+                for number in range(1, collection.episodes + 1)
+            ]}],
+            "last_episode": episode(collection.watched),
+            "next_episode": episode(collection.watched + 1),
+        }
+
+
+class NewznabHandler(Handler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        if url.path.startswith("/getnzb/"):
+            self.server.count("getnzb")
+            self.reply(200, NZB, "application/x-nzb")
+            return
+
+        kind = params.get("t", "")
+        self.server.count(f"t={kind}")
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if kind != "caps" and random.random() < self.server.error_rate:
+            self.reply(503, b"Service unavailable", "text/plain")
+            return
+
+        if kind == "caps":
+            body = (
+                '<?xml version="1.0" encoding="UTF-8"?><caps><searching>'
+                '<search available="yes" supportedParams="q"/>'
+                '<tv-search available="yes" supportedParams="q,season,ep,tvdbid,imdbid,tmdbid"/>'
+                '</searching></caps>'
+            )
+        elif kind in ("tvsearch", "search"):
+            body = self.results(params)
+        else:
+            body = '<?xml version="1.0" encoding="UTF-8"?><error code="202" description="No such function"/>'
+        self.reply(200, body.encode(), "application/rss+xml")
+
+    def find(self, params):
+        """Return (show index, season, episodes) requested by a search"""
+        collection = self.server.collection
+        for id_name in ("tvdbid", "imdbid", "tmdbid"):
+            if id_name in params:
+                index = collection.index_for(id_name, params[id_name])
+                season = int(params.get("season", 1))
+                if "ep" in params:
+                    return index, season, [int(params["ep"])]
+                return index, season, list(range(1, collection.episodes + 1))
+
+        match = re.match(r"^(.+?) S(\d+)E(\d+)", params.get("q", ""), re.IGNORECASE)
+        if match:
+            index = collection.index_for_title(match.group(1))
+            return index, int(match.group(2)), [int(match.group(3))]
+        return None, None, []
+
+    def results(self, params):
+        collection = self.server.collection
+        index, season, episodes = self.find(params)
+        items = []
+        if index:
+            now = time.time()
+            for episode in episodes:
+                for resolution in RESOLUTIONS:
+                    name = release_name(collection.title(index), season, episode, resolution)
+                    size = RESOLUTION_SIZES_MB[resolution] * 1024 * 1024
+                    items.append(
+                        f"<item><title>{escape(name)}</title>"
+                        f"<guid>{self.server.name}-{name}</guid>"
+                        f"<link>{self.server.url}/getnzb/{escape(name)}.nzb</link>"
+                        f"<pubDate>{formatdate(now - 86400 * episode)}</pubDate>"
+                        f'<enclosure url="{self.server.url}/getnzb/{escape(name)}.nzb"'
+                        f' length="{size}" type="application/x-nzb"/>'
+                        f'<newznab:attr name="size" value="{size}"/>'
+                        f'<newznab:attr name="grabs" value="{episode * 10}"/>'
+                        "</item>"
+                    )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<rss version="2.0" xmlns:newznab="http://www.newznab.com/DTD/2010/feeds/attributes/">'
+            f'<channel><newznab:response offset="0" total="{len(items)}"/>{"".join(items)}</channel></rss>'
+        )
+
+
+class NZBGetHandler(Handler):
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if isinstance(request, list):
+            self.server.count("batch")
+            reply = [self.call(call) for call in request]
+        else:
+            reply = self.call(request)
+        self.reply(200, json.dumps(reply).encode())
+
+    def call(self, request):
+        method = request.get("method")
+        self.server.count(method)
+        with self.server.lock:
+            if method == "listgroups":
+                result = list(self.server.queue)
+            elif method == "history":
+                result = []
+            elif method == "append":
+                nzb_id = len(self.server.queue) + 1
+                name = re.sub(r"\.nzb$", "", request["params"][0])
+                self.server.queue.append({"NZBID": nzb_id, "NZBName": name, "Status": "QUEUED"})
+                result = nzb_id
+            else:
+                return {"id": request.get("id"), "error": {"code": -32601, "message": "Method not found"}}
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+
+
+def start_servers(collection, indexers=2, latency=0.0, error_rate=0.0):
+    """Start the Trakt, NZBGet and indexer servers"""
+    trakt = CountingServer(TraktHandler, collection=collection).start()
+    nzbget = CountingServer(NZBGetHandler, queue=[]).start()
+    newznab = [
+        CountingServer(NewznabHandler, collection=collection, name=f"indexer{number}",
+                       latency=latency, error_rate=error_rate).start()
+        for number in range(1, indexers + 1)
+    ]
+    return trakt, nzbget, newznab
@@ -0,0 +1,233 @@
+"""
+End-to-end benchmark of the downloader and organizer against local fake servers
+
+Generates a synthetic Trakt collection, media library and download folder,
+then runs a cold download, a warm download and an organize pass, each in its
+own process against a private copy of src/ and its settings. Every phase
+reports wall time, time per instrumented phase, HTTP requests per endpoint,
+filesystem calls and peak RSS.
+
+    python benchmarks/run_benchmark.py --shows 200 --episodes 20 --output after.json
+    python benchmarks/run_benchmark.py --compare before.json after.json
+"""
+import argparse
+import builtins
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import yaml
+
+from fake_servers import Collection, release_name, start_servers
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = [("download", "cold"), ("download", "warm"), ("organize", "warm")]
+FS_CALLS = ["stat", "lstat", "scandir", "listdir", "mkdir", "rename", "replace",
+            "remove", "unlink", "rmdir", "chmod"]
+
+
+def build_install(workdir, servers, collection):
+    """Copy the code under test and write its settings, library and download folders"""
+    trakt, nzbget, newznab = servers
+    install = os.path.join(workdir, "traktarr")
+    shutil.copytree(os.path.join(REPO, "src"), os.path.join(install, "src"),
+                    ignore=shutil.ignore_patterns("__pycache__"))
+    shutil.copy(os.path.join(REPO, "settings.default.yaml"), install)
+
+    media = os.path.join(workdir, "library")
+    unorganized = os.path.join(workdir, "unorganized")
+    settings = {
+        "TRAKT_API_URL": trakt.url,
+        "TRAKT_CLIENT_ID": "benchmark",
+        "TRAKT_ACCESS_TOKEN": "benchmark",
+        "NZBGET_URL": f"{nzbget.url}/jsonrpc",
+        "NZBGET_USERNAME": "benchmark",
+        "NZBGET_PASSWORD": "benchmark",
+        "MEDIA_LIBRARY_TV_SHOWS_PATH": media,
+        "UNORGANIZED_TV_SHOWS_PATH": unorganized,
+        "DATA_PATH": os.path.join(workdir, "data"),
+        "RESOLUTIONS": ["1080p", "720p"],
+        "INDEXERS": [
+            {"name": server.name, "url": f"{server.url}/api", "api_key": "benchmark",
+             "enabled": True, "priority": number, "timeout": 10}
+            for number, server in enumerate(newznab, 1)
+        ],
+    }
+    with open(os.path.join(install, "settings.local.yaml"), "w") as f:
+        yaml.safe_dump(settings, f)
+
+    # Every show has the watched episodes plus the first next one in the library,
+    # so the organizer has watched files to clean up and the downloader has one
+    # missing episode per show to search for
+    for index in range(1, collection.shows + 1):
+        title = collection.title(index)
+        season_dir = os.path.join(media, f"{title} ({2000 + index % 25})", "Season 01")
+        os.makedirs(season_dir)
+        for episode in range(1, collection.watched + 2):
+            open(os.path.join(season_dir, release_name(title, 1, episode, "1080p") + ".mkv"), "w").close()
+
+    # Finished downloads: the second next episode of every other show, plus
+    # the same number of releases nobody wants
+    os.makedirs(unorganized)
+    for index in range(1, collection.shows + 1):
+        episode = collection.watched + 2 if index % 2 else collection.episodes + 1
+        folder = os.path.join(unorganized, release_name(collection.title(index), 1, episode, "1080p"))
+        os.makedirs(folder)
+        open(os.path.join(folder, "video.mkv"), "w").close()
+        open(os.path.join(folder, "video.nfo"), "w").close()
+    return install
+
+
+def run_phase(install, phase):
+    """Run one phase in a fresh interpreter and return its measurements"""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", phase, install],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise RuntimeError(f"{phase} phase failed with exit status {result.returncode}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def count_fs_calls(counts):
+    """Wrap os and open so every filesystem call made by the code under test is counted"""
+    def wrap(name, function):
+        def counted(*args, **kwargs):
+            counts[name] += 1
+            return function(*args, **kwargs)
+        return counted
+
+    for name in FS_CALLS:
+        setattr(os, name, wrap(name, getattr(os, name)))
+    builtins.open = wrap("open", builtins.open)
+
+
+def child(phase, install):
+    """Entry point of a phase process: run it quietly and print one JSON line"""
+    sys.path.insert(0, os.path.join(install, "src"))
+    fs_calls = Counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        if phase == "download":
+            from downloader import ShowDownloader
+            count_fs_calls(fs_calls)
+            ShowDownloader().run()
+        else:
+            from organizer import VideoOrganizer
+            count_fs_calls(fs_calls)
+            VideoOrganizer().run()
+        wall = time.perf_counter() - started
+    from instrumentation import stats
+
+    print(json.dumps({
+        "wall_s": round(wall, 4),
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        // (1024 if sys.platform == "darwin" else 1),
+        "fs": dict(fs_calls),
+        "fs_total": sum(fs_calls.values()),
+        "phases_s": {name: round(total, 4) for name, (_, total) in sorted(stats.phases.items())},
+    }))
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "-C", REPO, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(args):
+    collection = Collection(args.shows, args.episodes)
+    servers = start_servers(collection, indexers=args.indexers,
+                            latency=args.latency_ms / 1000, error_rate=args.error_rate)
+    trakt, nzbget, newznab = servers
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="traktarr-bench-") as workdir:
+        install = build_install(workdir, servers, collection)
+        for phase, state in PHASES:
+            for server in (trakt, nzbget, *newznab):
+                server.take_counts()
+            run = {"phase": phase, "state": state, **run_phase(install, phase)}
+            http = {f"trakt {endpoint}": count for endpoint, count in trakt.take_counts().items()}
+            http.update({f"nzbget {method}": count for method, count in nzbget.take_counts().items()})
+            for server in newznab:
+                for endpoint, count in server.take_counts().items():
+                    http[f"newznab {endpoint}"] = http.get(f"newznab {endpoint}", 0) + count
+            run["http"] = dict(sorted(http.items()))
+            run["http_total"] = sum(http.values())
+            runs.append(run)
+            print(f"{phase:8} {state:4} {run['wall_s']:8.2f}s {run['http_total']:6} requests "
+                  f"{run['fs_total']:7} fs calls {run['peak_rss_kb'] / 1024:7.1f} MB peak RSS",
+                  file=sys.stderr)
+
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"shows": args.shows, "episodes": args.episodes, "indexers": args.indexers,
+                   "latency_ms": args.latency_ms, "error_rate": args.error_rate},
+        "runs": runs,
+    }
+
+
+def compare(baseline_path, current_path):
+    """Print how each phase changed between two result files"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+    if baseline["params"] != current["params"]:
+        print("Warning: the runs used different parameters")
+    before = {(run["phase"], run["state"]): run for run in baseline["runs"]}
+    for run in current["runs"]:
+        old = before.get((run["phase"], run["state"]))
+        if not old:
+            continue
+        changes = []
+        for metric in ("wall_s", "http_total", "fs_total", "peak_rss_kb"):
+            change = (run[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            changes.append(f"{metric} {old[metric]} -> {run[metric]} ({change:+.1f}%)")
+        print(f"{run['phase']} {run['state']}: " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--shows", type=int, default=50, help="shows in the collection")
+    parser.add_argument("--episodes", type=int, default=20, help="aired episodes per show")
+    parser.add_argument("--indexers", type=int, default=2, help="fake Newznab indexers")
+    parser.add_argument("--latency-ms", type=float, default=20, help="indexer response delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of failed indexer searches")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--child", nargs=2, metavar=("PHASE", "INSTALL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = benchmark(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
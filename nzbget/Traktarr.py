@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+#
+##############################################################################
+### NZBGET POST-PROCESSING SCRIPT                                          ###
+
+# Organize a finished download into the TV library with Traktarr.
+#
+# Runs "traktarr.py organize-one" on the completed directory, so the episode
+# shows up in the library right away instead of on the next organizer run.
+
+##############################################################################
+### OPTIONS                                                                ###
+
+# Path to the traktarr directory.
+#TraktarrPath=/data/data/com.termux/files/home/traktarr
+
+# Python interpreter used to run Traktarr.
+#Python=python3
+
+# Only organize downloads in this category (leave empty for all categories).
+#Category=Series
+
+### NZBGET POST-PROCESSING SCRIPT                                          ###
+##############################################################################
+
+import os
+import subprocess
+import sys
+
+POSTPROCESS_SUCCESS = 93
+POSTPROCESS_ERROR = 94
+POSTPROCESS_NONE = 95
+
+# Exit status of organize-one when the download held no wanted episode
+NOTHING_ORGANIZED = 3
+
+
+def main():
+    if "NZBPP_TOTALSTATUS" not in os.environ:
+        print("[ERROR] This script must be run by NZBGet 13 or later as a post-processing script")
+        return POSTPROCESS_ERROR
+
+    status = os.environ["NZBPP_TOTALSTATUS"]
+    if status != "SUCCESS":
+        print(f"[INFO] Skipping download with status {status}")
+        return POSTPROCESS_NONE
+
+    category = os.environ.get("NZBPO_CATEGORY", "")
+    if category and os.environ.get("NZBPP_CATEGORY", "") != category:
+        print(f"[INFO] Skipping download outside category {category}")
+        return POSTPROCESS_NONE
+
+    # NZBPP_FINALDIR is set when another script has already moved the files
+    directory = os.environ.get("NZBPP_FINALDIR") or os.environ["NZBPP_DIRECTORY"]
+    traktarr = os.path.join(
+        os.path.expanduser(os.environ.get("NZBPO_TRAKTARRPATH", "")), "src", "traktarr.py"
+    )
+    if not os.path.exists(traktarr):
+        print(f"[ERROR] Traktarr not found at {traktarr}, check the TraktarrPath option")
+        return POSTPROCESS_ERROR
+
+    python = os.environ.get("NZBPO_PYTHON") or sys.executable
+    result = subprocess.run([python, traktarr, "organize-one", directory])
+    if result.returncode == 0:
+        return POSTPROCESS_SUCCESS
+    if result.returncode == NOTHING_ORGANIZED:
+        return POSTPROCESS_NONE
+    print(f"[ERROR] Traktarr failed with exit status {result.returncode}")
+    return POSTPROCESS_ERROR
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import threading
+import time
+
+# How many writes happen between checks of the size bound
+EVICTION_INTERVAL = 50
+
+
+class CacheEntry:
+    """A cached value with its validator and freshness"""
+    __slots__ = ("value", "etag", "stored_at", "expires_at")
+
+    def __init__(self, value, etag, stored_at, expires_at):
+        self.value = value
+        self.etag = etag
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires_at
+
+
+class SQLiteCache:
+    """
+    Small persistent key/value cache backed by SQLite
+    Entries carry a TTL and an optional ETag, and the least recently used
+    entries are evicted once the cache grows beyond max_entries
+    """
+    def __init__(self, path, max_entries=5000):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT, etag TEXT,"
+            " stored_at REAL, expires_at REAL, accessed_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self.evict()
+
+    def get(self, key):
+        """Return the CacheEntry for key, fresh or stale, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, etag, stored_at, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+        return CacheEntry(*row)
+
+    def set(self, key, value, ttl, etag=None):
+        """Store a value that stays fresh for ttl seconds"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value, etag, now, now + ttl, now),
+            )
+            self._writes += 1
+            if self._writes % EVICTION_INTERVAL == 0:
+                self._evict()
+
+    def touch(self, key, ttl):
+        """Mark an entry as fresh again after a successful revalidation"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE entries SET expires_at = ?, accessed_at = ? WHERE key = ?",
+                (now + ttl, now, key),
+            )
+
+    def delete(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _evict(self):
+        self._db.execute(
+            "DELETE FROM entries WHERE key IN ("
+            " SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def evict(self):
+        """Drop the least recently used entries beyond max_entries"""
+        with self._lock:
+            self._evict()
+
+    def close(self):
+        with self._lock:
+            self._evict()
+            self._db.close()
@@ -1,23 +1,76 @@
+import json
 import os
-import yaml
+from collections.abc import Mapping
 from typing import Dict
 
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SETTINGS_PATH = os.path.join(SCRIPT_DIR, "..", "settings.default.yaml")
+LOCAL_SETTINGS_PATH = os.path.join(SCRIPT_DIR, "..", "settings.local.yaml")
+# The merged YAML settings are cached as JSON so that, while neither settings
+# file changes, startup needs neither PyYAML nor a YAML parse
+CACHE_PATH = os.path.join(SCRIPT_DIR, "..", ".settings.cache.json")
 
-def load_settings() -> Dict:
-    script_dir = os.path.dirname(os.path.abspath(__file__))
+# Settings each part of Traktarr needs, checked when that part starts
+REQUIRED_SETTINGS = {
+    "trakt": ["TRAKT_CLIENT_ID", "TRAKT_ACCESS_TOKEN"],
+    "authorize": ["TRAKT_CLIENT_ID", "TRAKT_CLIENT_SECRET"],
+    "nzbget": ["NZBGET_URL", "NZBGET_USERNAME", "NZBGET_PASSWORD"],
+}
+
+
+def _file_key(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _read_yaml_settings() -> Dict:
+    import yaml
 
     # Load default settings
-    default_settings_path = os.path.join(script_dir, "..", "settings.default.yaml")
-    with open(default_settings_path, "r") as f:
+    with open(DEFAULT_SETTINGS_PATH, "r") as f:
         settings = yaml.safe_load(f)
 
     # Load and merge local settings if they exist
-    local_settings_path = os.path.join(script_dir, "..", "settings.local.yaml")
-    if os.path.exists(local_settings_path):
-        with open(local_settings_path, "r") as f:
+    if os.path.exists(LOCAL_SETTINGS_PATH):
+        with open(LOCAL_SETTINGS_PATH, "r") as f:
             local_settings = yaml.safe_load(f)
             if local_settings:
                 settings.update(local_settings)
+    return settings
+
+
+def _read_merged_settings() -> Dict:
+    """Return the merged settings files, from the cache while they are unchanged"""
+    key = [_file_key(DEFAULT_SETTINGS_PATH), _file_key(LOCAL_SETTINGS_PATH)]
+    try:
+        with open(CACHE_PATH, "r") as f:
+            cached = json.load(f)
+        if cached.get("key") == key:
+            return cached["settings"]
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    settings = _read_yaml_settings()
+    try:
+        tmp_path = f"{CACHE_PATH}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        # The cache holds every token, password and API key, so only the owner may read it
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"key": key, "settings": settings}, f)
+        os.replace(tmp_path, CACHE_PATH)
+    except (OSError, TypeError, ValueError):
+        # Read-only install or values JSON can't hold; parse again next time
+        pass
+    return settings
+
+
+def load_settings() -> Dict:
+    settings = _read_merged_settings()
 
     # Expand paths
     settings["MEDIA_LIBRARY_TV_SHOWS_PATH"] = os.path.expanduser(
@@ -26,36 +79,62 @@ def load_settings() -> Dict:
     settings["UNORGANIZED_TV_SHOWS_PATH"] = os.path.expanduser(
         settings["UNORGANIZED_TV_SHOWS_PATH"]
     )
+    settings["DATA_PATH"] = os.path.abspath(os.path.expanduser(
+        settings.get("DATA_PATH") or os.path.join(SCRIPT_DIR, "..", "data")
+    ))
+    return settings
 
-    # Validate required settings
-    required_settings = [
-        "TRAKT_CLIENT_ID",
-        "TRAKT_ACCESS_TOKEN",
-        "NZBGET_URL",
-        "NZBGET_USERNAME",
-        "NZBGET_PASSWORD",
-        "INDEXERS",
-    ]
-
-    missing_settings = [s for s in required_settings if not settings.get(s)]
-    if missing_settings:
-        raise ValueError(
-            f"Missing required settings: {', '.join(missing_settings)}\n"
-            f"Please add them to settings.local.yaml"
-        )
-
-    # Validate that at least one indexer is properly configured
-    if not any(
-        idx.get("enabled", False) and idx.get("api_key")
-        for idx in settings.get("INDEXERS", [])
-    ):
-        raise ValueError(
-            "No enabled indexers with API keys found in settings.\n"
-            "Please configure at least one indexer in settings.local.yaml"
-        )
 
-    return settings
+class Settings(Mapping):
+    """
+    Read-only view of the settings, loaded on first access and then kept
+    Commands only pay for settings they use, and require() checks the
+    settings of each part as it starts, so e.g. authorizing with Trakt
+    works before any indexer is configured.
+    """
+    def __init__(self):
+        self._settings = None
+
+    def _loaded(self):
+        if self._settings is None:
+            self._settings = load_settings()
+        return self._settings
+
+    def __getitem__(self, key):
+        return self._loaded()[key]
+
+    def __iter__(self):
+        return iter(self._loaded())
+
+    def __len__(self):
+        return len(self._loaded())
+
+    def missing(self, *parts):
+        """Return the required settings of the given parts that are not set"""
+        names = [name for part in parts for name in REQUIRED_SETTINGS[part]]
+        return [name for name in dict.fromkeys(names) if not self.get(name)]
+
+    def require(self, *parts):
+        """Raise ValueError unless the settings of the given parts are set"""
+        missing_settings = self.missing(*parts)
+        if missing_settings:
+            raise ValueError(
+                f"Missing required settings: {', '.join(missing_settings)}\n"
+                f"Please add them to settings.local.yaml"
+            )
+
+    def enabled_indexers(self):
+        return [idx for idx in self.get("INDEXERS") or []
+                if idx.get("enabled", False) and idx.get("api_key")]
+
+    def require_indexers(self):
+        """Raise ValueError unless at least one indexer is properly configured"""
+        if not self.enabled_indexers():
+            raise ValueError(
+                "No enabled indexers with API keys found in settings.\n"
+                "Please configure at least one indexer in settings.local.yaml"
+            )
 
 
-# Load settings once when module is imported
-settings = load_settings()
+# Loaded on first access, not at import
+settings = Settings()
@@ -0,0 +1,90 @@
+import logging
+import random
+import signal
+import threading
+import time
+from config import settings
+from downloader import ShowDownloader
+from instrumentation import log_summary
+from organizer import VideoOrganizer
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """A cycle run every interval seconds, give or take the jitter"""
+    __slots__ = ("name", "run", "interval", "next_run")
+
+    def __init__(self, name, run, interval):
+        self.name = name
+        self.run = run
+        self.interval = interval
+        self.next_run = 0.0
+
+
+class Daemon:
+    """
+    Keeps one process alive and runs the downloader and organizer on intervals
+    Both live for the whole process, so connection pools, caches and library
+    indexes stay warm between cycles. Jobs run one at a time and the next run
+    is scheduled from when a cycle finishes, so a cycle that overruns its
+    interval is followed by a single run rather than a backlog. SIGTERM and
+    SIGINT let the current cycle finish, then stop the daemon.
+    """
+    def __init__(self):
+        self.jitter = settings["DAEMON_JITTER"]
+        self.downloader = None
+        self.organizer = None
+        self.jobs = [
+            Job("download", self._download, settings["DAEMON_DOWNLOAD_INTERVAL"]),
+            Job("organize", self._organize, settings["DAEMON_ORGANIZE_INTERVAL"]),
+        ]
+        self._stop = threading.Event()
+
+    def _download(self):
+        if self.downloader is None:
+            self.downloader = ShowDownloader()
+        self.downloader.run()
+
+    def _organize(self):
+        if self.organizer is None:
+            self.organizer = VideoOrganizer()
+        else:
+            self.organizer.load_wanted()
+        self.organizer.run()
+
+    def stop(self, signum=None, frame=None):
+        if not self._stop.is_set():
+            logger.info("Stopping after the current cycle...")
+        self._stop.set()
+
+    def _schedule(self, job):
+        delay = job.interval + random.uniform(-self.jitter, self.jitter)
+        job.next_run = time.monotonic() + max(delay, 0)
+
+    def run(self):
+        """Run cycles until stopped"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        intervals = ", ".join(f"{job.name} every {job.interval}s" for job in self.jobs)
+        logger.info(f"Daemon started: {intervals}")
+
+        while not self._stop.is_set():
+            job = min(self.jobs, key=lambda j: j.next_run)
+            wait = job.next_run - time.monotonic()
+            if wait > 0 and self._stop.wait(wait):
+                break
+
+            logger.info(f"{job.name} cycle started")
+            started = time.monotonic()
+            try:
+                job.run()
+            except Exception:
+                logger.exception(f"Error during {job.name} cycle")
+            logger.info(f"{job.name} cycle took {time.monotonic() - started:.1f}s")
+            log_summary()
+            self._schedule(job)
+
+        if self.downloader:
+            self.downloader.close()
+        logger.info("Daemon stopped")
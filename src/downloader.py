@@ -1,304 +1,686 @@
+import logging
 import os
-import re
+import json
+import time
 import requests
 import base64
+import tempfile
+import zlib
 import xml.etree.ElementTree as ET
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from requests.adapters import HTTPAdapter
+from cache import SQLiteCache
 from config import settings
-from utils import (
-    normalize_name, is_similar, get_shows_in_collection,
-    get_last_watched_and_next_episodes, extract_show_info, shows_match
-)
+from grab_history import GrabHistory, SENT, FAILED
+from instrumentation import instrument_session, log_summary, phase, setup_logging
+from library_index import LibraryIndex
+from newznab import NewznabResult, iter_results
+from nzbget_client import NZBGetClient, NZBGetUnavailable
+from ranking import rank_releases, resolution_rank
+from release_parser import parse_release
+from snapshot import save_wanted_snapshot
+from trakt_sync import IncrementalSync
+from utils import normalize_name, get_shows_in_collection, EpisodeIndex
+
+logger = logging.getLogger(__name__)
+
+# Newznab tvsearch id parameters, in order of preference, and the Trakt ids
+# that feed them (Trakt has no TVmaze ids, so tvmazeid is never sent)
+TV_SEARCH_IDS = [
+    ('tvdbid', 'tvdb'),
+    ('imdbid', 'imdb'),
+    ('tmdbid', 'tmdb'),
+    ('rid', 'tvrage'),
+]
+CAPS_TTL = 7 * 24 * 3600
+
+# An episode search can take up to a season query, an episode query and a
+# free-text query, so concurrent searches wait this many timeouts per indexer
+SEARCH_ATTEMPTS = 3
+
+MB = 1024 * 1024
+# NZBs are read in chunks that are a multiple of 3 bytes, so each encodes to
+# base64 without padding, and spill to disk past NZB_SPOOL_SIZE
+NZB_CHUNK_SIZE = 48 * 1024
+NZB_SPOOL_SIZE = 1 * MB
+NZB_PLACEHOLDER = "\0nzb\0"
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _inflate(decompressor, data):
+    """Decompress data in pieces of at most NZB_CHUNK_SIZE bytes, so a gzip bomb can't balloon memory"""
+    while data:
+        yield decompressor.decompress(data, NZB_CHUNK_SIZE)
+        data = decompressor.unconsumed_tail
+
 
 class ShowDownloader:
     def __init__(self):
-        self.nzbget_url = settings['NZBGET_URL']
-        self.nzbget_username = settings['NZBGET_USERNAME']
-        self.nzbget_password = settings['NZBGET_PASSWORD']
-        self.indexers = [idx for idx in settings['INDEXERS'] 
-                        if idx['enabled'] and idx['api_key']]
+        settings.require("trakt", "nzbget")
+        settings.require_indexers()
+        self.nzbget = NZBGetClient(
+            settings['NZBGET_URL'], settings['NZBGET_USERNAME'], settings['NZBGET_PASSWORD'],
+            timeout=settings['NZBGET_TIMEOUT']
+        )
+        self.nzbget_history_max_age = settings['NZBGET_HISTORY_MAX_AGE']
+        # NZBID -> episodes parsed from its name, or None for failed downloads,
+        # kept across runs so only new queue and history items are parsed
+        self._nzb_episodes = {}
+        self.indexers = settings.enabled_indexers()
         self.indexers.sort(key=lambda x: x.get('priority', 999))
         self.resolutions = settings['RESOLUTIONS']
         self.max_results = 50
+        self.search_mode = settings['INDEXER_SEARCH_MODE']
+        self.indexer_timeout = settings['INDEXER_TIMEOUT']
+        self.nzb_handoff = settings['NZB_HANDOFF']
+        self.nzb_max_size = settings['NZB_MAX_SIZE_MB'] * MB
+        self.session = instrument_session(requests.Session())
+        adapter = HTTPAdapter(pool_maxsize=max(len(self.indexers), 1) * 2)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._executor = None
+        self._caps = {}
+        self.search_cache = None
+        if settings['INDEXER_CACHE_ENABLED']:
+            self.search_cache = SQLiteCache(
+                os.path.join(settings['DATA_PATH'], 'indexer_cache.sqlite'),
+                max_entries=settings['INDEXER_CACHE_MAX_ENTRIES']
+            )
+        self.history = GrabHistory(
+            os.path.join(settings['DATA_PATH'], 'grab_history.sqlite'),
+            regrab_after=settings['GRAB_REGRAB_AFTER'],
+            retry_base=settings['GRAB_RETRY_BASE'],
+            retry_max=settings['GRAB_RETRY_MAX']
+        )
+        self._active_downloads = None
+        self._nzbget_unavailable = False
+        self.library = LibraryIndex(
+            settings['MEDIA_LIBRARY_TV_SHOWS_PATH'],
+            os.path.join(settings['DATA_PATH'], 'library_index.json')
+        )
+        self.unorganized = LibraryIndex(
+            settings['UNORGANIZED_TV_SHOWS_PATH'],
+            os.path.join(settings['DATA_PATH'], 'unorganized_index.json'),
+            index_folders=True
+        )
+        self._indexes_fresh = False
+        self.sync = IncrementalSync()
 
-    def _normalize_nzbget_name(self, name):
-        """
-        Special normalization for NZBGet names that preserves episode numbers
-        while making comparison reliable
-        """
-        # Remove file extension if present
-        if name.endswith('.nzb'):
-            name = name[:-4]
-        
-        # Convert to lowercase
-        name = name.lower()
-        
-        # Replace dots with spaces but preserve episode numbers
-        name = re.sub(r'\.(?!(S\d{2}E\d{2}))', ' ', name)
-        
-        # Remove any duplicate spaces
-        name = re.sub(r'\s+', ' ', name)
-        
-        return name.strip()
-    
     def _get_nzbget_active_downloads(self):
         """
-        Get list of active downloads from NZBGet with parsed show info
-        Returns list of dicts with show_name, season, episode
+        Get active downloads from NZBGet as an EpisodeIndex
+        The queue is fetched once per run and updated in place by send_to_nzbget
         """
-        headers = {"Content-Type": "application/json"}
-        payload = {
-            "method": "listgroups",
-            "params": []
-        }
+        if self._active_downloads is None:
+            with phase("nzbget query"):
+                self._active_downloads = self._fetch_nzbget_active_downloads()
+        return self._active_downloads
 
+    def _fetch_nzbget_active_downloads(self):
+        """
+        Fetch NZBGet's queue and recent history in one round trip
+        Completed downloads count as existing until they are older than
+        NZBGET_HISTORY_MAX_AGE, and failed ones get their release blocklisted.
+        NZBGet's JSON-RPC has no change ids to poll for, so both lists are
+        fetched whole, but names are only parsed for NZBIDs not seen before.
+        """
+        active_downloads = EpisodeIndex()
         try:
-            response = requests.post(
-                self.nzbget_url,
-                json=payload,
-                auth=(self.nzbget_username, self.nzbget_password),
-                headers=headers
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            if not result.get("result"):
-                return []
-                
-            active_downloads = []
-            print("\nCurrent NZBGet downloads:")
-            for group in result["result"]:
-                status = group.get("Status", "")
-                filename = group.get("NZBName", "")
-                
-                print(f"Found in NZBGet - Name: {filename}, Status: {status}")
-                
-                # Skip if definitely done or failed
-                if status in ["DELETED", "FAILED"]:
-                    continue
-
-                info = extract_show_info(filename)
-                if info:
-                    show_name, season, episode = info
-                    active_downloads.append({
-                        'show_name': show_name,
-                        'season': season,
-                        'episode': episode,
-                        'full_name': filename
-                    })
-                    print(f"Extracted: Show='{show_name}', S{season:02}E{episode:02}")
-            
-            return active_downloads
-            
+            groups, history = self.nzbget.batch([("listgroups", [0]), ("history", [False])])
         except Exception as e:
-            print(f"Error getting NZBGet downloads: {e}")
+            logger.error(f"Error getting NZBGet downloads: {e}")
+            return active_downloads
+
+        cutoff = time.time() - self.nzbget_history_max_age
+        items = [(group, group.get("NZBName", "")) for group in groups or []]
+        items += [(item, item.get("Name", "")) for item in history or []
+                  if item.get("HistoryTime", 0) >= cutoff]
+
+        nzb_episodes = {}
+        new_items = 0
+        for item, name in items:
+            nzb_id = item.get("NZBID")
+            if nzb_id in self._nzb_episodes:
+                episodes = self._nzb_episodes[nzb_id]
+            else:
+                new_items += 1
+                episodes = self._parse_nzbget_item(item, name)
+            nzb_episodes[nzb_id] = episodes
+            for show_name, season, episode in episodes or ():
+                active_downloads.add(show_name, season, episode, name)
+        self._nzb_episodes = nzb_episodes
+        logger.info(f"NZBGet: {len(items)} queued or recent downloads, {new_items} new")
+        return active_downloads
+
+    def _parse_nzbget_item(self, item, name):
+        """Return the episodes of a queue or history item, or None if it failed"""
+        status = item.get("Status", "")
+        logger.debug(f"Found in NZBGet - Name: {name}, Status: {status}")
+
+        # Skip if definitely done or failed
+        if status in ["DELETED", "FAILED"] or status.startswith(("FAILURE", "DELETED")):
+            if status.startswith("FAILURE"):
+                self.history.block_title(name)
+            return None
+
+        parsed = parse_release(name)
+        if not parsed or parsed.season is None:
             return []
+        logger.debug(f"Extracted: Show='{parsed.show}', S{parsed.season:02}E{parsed.episode:02}")
+        return [(parsed.show, parsed.season, episode) for episode in parsed.episodes]
 
     def _episode_exists(self, show_name, season, episode):
         """
         Check if episode already exists in organized folder, unorganized folder,
         or is being downloaded
         """
-        print(f"\nChecking if episode exists: {show_name} S{season:02}E{episode:02}")
+        logger.debug(f"Checking if episode exists: {show_name} S{season:02}E{episode:02}")
         
         # Check NZBGet active downloads first
-        print("Checking NZBGet active downloads")
-        active_downloads = self._get_nzbget_active_downloads()
-        for download in active_downloads:
-            if (download['season'] == season and 
-                download['episode'] == episode and 
-                shows_match(show_name, download['show_name'])):
-                print(f"Episode is being downloaded: {download['full_name']}")
-                return True
+        logger.debug("Checking NZBGet active downloads")
+        download = self._get_nzbget_active_downloads().find(show_name, season, episode)
+        if download:
+            logger.debug(f"Episode is being downloaded: {download}")
+            return True
                         
+        # Refresh the library indexes once per run
+        if not self._indexes_fresh:
+            with phase("library scan"):
+                self.library.refresh()
+                self.unorganized.refresh()
+            self._indexes_fresh = True
+
         # Check organized TV Shows folder
-        organized_path = settings['MEDIA_LIBRARY_TV_SHOWS_PATH']
-        print(f"Checking organized folder: {organized_path}")
-        
-        for root, _, files in os.walk(organized_path):
-            for file in files:
-                if not file.endswith((".mkv", ".mp4", ".avi")):
-                    continue
-                    
-                info = extract_show_info(file)
-                if not info:
-                    continue
-                    
-                file_show, file_season, file_episode = info
-                if (file_season == season and 
-                    file_episode == episode and 
-                    shows_match(show_name, file_show)):
-                    print(f"Episode found in organized folder: {file}")
-                    return True
+        logger.debug(f"Checking organized folder: {self.library.root}")
+        file_path = self.library.find(show_name, season, episode)
+        if file_path:
+            logger.debug(f"Episode found in organized folder: {os.path.basename(file_path)}")
+            return True
 
         # Check unorganized TV Shows folder
-        unorganized_path = settings['UNORGANIZED_TV_SHOWS_PATH']
-        print(f"Checking unorganized folder: {unorganized_path}")
-        for item in os.listdir(unorganized_path):
-            if not os.path.isdir(os.path.join(unorganized_path, item)):
-                continue
-                
-            info = extract_show_info(item)
-            if not info:
-                continue
-                
-            folder_show, folder_season, folder_episode = info
-            if (folder_season == season and 
-                folder_episode == episode and 
-                shows_match(show_name, folder_show)):
-                print(f"Episode found in unorganized folder: {item}")
-                return True
-
-        print(f"Episode not found: {show_name} S{season:02}E{episode:02}")
+        logger.debug(f"Checking unorganized folder: {self.unorganized.root}")
+        item_path = self.unorganized.find(show_name, season, episode)
+        if item_path:
+            logger.debug(f"Episode found in unorganized folder: {os.path.basename(item_path)}")
+            return True
+
+        logger.debug(f"Episode not found: {show_name} S{season:02}E{episode:02}")
         return False
 
 
     def process_show(self, show):
-        """Process a single show"""
+        """Process a single show, returning its next episodes"""
         show_name = show["show"]["title"]
-        show_slug = show["show"]["ids"]["slug"]
 
-        print(f"\nProcessing show: {show_name}")
-        _, next_episodes = get_last_watched_and_next_episodes(show_slug)
+        logger.debug(f"Processing show: {show_name}")
+        with phase("trakt sync"):
+            _, next_episodes = self.sync.next_episodes(show)
 
         if not next_episodes:
-            print("No episodes to download")
-            return
+            logger.debug("No episodes to download")
+            return next_episodes or []
 
+        missing = []
         for next_ep in next_episodes:
             season = next_ep["season"]
             episode = next_ep["number"]
             
             # Check if episode already exists or is being downloaded
             if self._episode_exists(show_name, season, episode):
-                print(f"Skipping S{season:02}E{episode:02} - already exists or downloading")
+                logger.debug(f"Skipping S{season:02}E{episode:02} - already exists or downloading")
                 continue
-            
+            missing.append((season, episode))
+
+        # Several missing episodes of a season can share one season-level search
+        missing_per_season = Counter(season for season, _ in missing)
+        for season, episode in missing:
             # Proceed with download if episode doesn't exist
-            for resolution in self.resolutions:
-                if self.find_and_download_episode(show_name, season, episode, resolution):
-                    break
+            self.find_and_download_episode(
+                show_name, season, episode,
+                show_ids=show["show"]["ids"],
+                whole_season=missing_per_season[season] > 1
+            )
+        return next_episodes
+
+    def search_indexer(self, indexer, params):
+        """
+        Search a single indexer with Newznab params, returning parsed results
+        Results are cached per indexer and query: hits for INDEXER_CACHE_TTL
+        and empty searches for INDEXER_CACHE_NEGATIVE_TTL. Errors are not cached.
+        """
+        query = " ".join(
+            f"{key}={' '.join(str(value).lower().split())}" for key, value in sorted(params.items())
+        )
+        cache_key = f"{indexer['name']}|{query}"
+        if self.search_cache:
+            entry = self.search_cache.get(cache_key)
+            if entry and entry.fresh:
+                results = [NewznabResult.from_dict(data) for data in json.loads(entry.value)]
+                logger.debug(f"Using cached {indexer['name']} results for: {query} ({len(results)} results)")
+                return results
 
-    def search_indexer(self, indexer, normalized_query):
-        """Search a single indexer for a query"""
-        print(f"\nSearching {indexer['name']} for: {normalized_query}")
+        logger.info(f"Searching {indexer['name']} for: {query}")
         url = f"{indexer['url']}"
-        params = {
-            't': 'search',
-            'q': normalized_query,
-            'apikey': indexer['api_key']
-        }
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            return response.text
+            with self.session.get(
+                url, params={**params, 'apikey': indexer['api_key']},
+                timeout=indexer.get('timeout', self.indexer_timeout), stream=True
+            ) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                results = self.parse_nzbgeek_results(response.raw)  # Can keep same parser as it's standard Newznab XML
         except Exception as e:
-            print(f"Error searching {indexer['name']}: {e}")
+            logger.warning(f"Error searching {indexer['name']}: {e}")
             return None
 
-    def parse_nzbgeek_results(self, xml_data):
-        """Parse NZBGeek XML results"""
-        root = ET.fromstring(xml_data)
-        items = root.findall("./channel/item")
-        results = []
-        for item in items[:self.max_results]:
-            results.append({
-                "title": item.find("title").text,
-                "nzb_url": item.find("link").text,
-            })
+        if self.search_cache:
+            ttl = settings['INDEXER_CACHE_TTL'] if results else settings['INDEXER_CACHE_NEGATIVE_TTL']
+            self.search_cache.set(cache_key, json.dumps([r.to_dict() for r in results]), ttl)
         return results
+
+    def _get_tv_search_params(self, indexer):
+        """
+        Return the tv-search parameters an indexer supports
+        The t=caps probe runs once per indexer and is cached for CAPS_TTL
+        """
+        name = indexer['name']
+        if name in self._caps:
+            return self._caps[name]
+
+        cache_key = f"{name}|caps"
+        entry = self.search_cache.get(cache_key) if self.search_cache else None
+        if entry and entry.fresh:
+            supported = json.loads(entry.value)
+        else:
+            try:
+                response = self.session.get(
+                    indexer['url'], params={'t': 'caps', 'apikey': indexer['api_key']},
+                    timeout=indexer.get('timeout', self.indexer_timeout)
+                )
+                response.raise_for_status()
+                tv_search = ET.fromstring(response.text).find('./searching/tv-search')
+                supported = []
+                if tv_search is not None and tv_search.get('available') == 'yes':
+                    supported = [
+                        param.strip()
+                        for param in tv_search.get('supportedParams', 'q').split(',')
+                    ]
+                if self.search_cache:
+                    self.search_cache.set(cache_key, json.dumps(supported), CAPS_TTL)
+            except Exception as e:
+                # Fall back to free-text search for this run
+                logger.warning(f"Error getting capabilities of {name}: {e}")
+                supported = []
+
+        logger.debug(f"{name} tv-search parameters: {', '.join(supported) or 'not supported'}")
+        self._caps[name] = set(supported)
+        return self._caps[name]
+
+    def _tv_search_params(self, indexer, show_ids, season, episode=None):
+        """
+        Build t=tvsearch params identifying the show by its Trakt-provided ids
+        Returns None when the indexer supports none of the ids we have
+        """
+        if not show_ids:
+            return None
+        supported = self._get_tv_search_params(indexer)
+        if 'season' not in supported or (episode is not None and 'ep' not in supported):
+            return None
+
+        for param, trakt_key in TV_SEARCH_IDS:
+            value = show_ids.get(trakt_key)
+            if value and param in supported:
+                id_param = {param: str(value).replace('tt', '') if param == 'imdbid' else value}
+                break
+        else:
+            return None
+
+        params = {'t': 'tvsearch', **id_param, 'season': season}
+        if episode is not None:
+            params['ep'] = episode
+        return params
+
+    def _search_episode(self, indexer, show_name, season, episode,
+                        show_ids=None, whole_season=False):
+        """
+        Search one indexer for an episode in every configured resolution
+        Structured tvsearch queries come first, trying a season-level query
+        when several episodes of the season are wanted; free-text search is
+        the fallback when those are unsupported or find nothing.
+        Returns None if a search failed and the others found nothing.
+        """
+        failed = False
+        for ep in ((None, episode) if whole_season else (episode,)):
+            params = self._tv_search_params(indexer, show_ids, season, ep)
+            if not params:
+                break
+            found = self.search_indexer(indexer, params)
+            if found is None:
+                failed = True
+                continue
+            results = [
+                result for result in found
+                if resolution_rank(result.title, self.resolutions) is not None
+                and parse_release(result.title)
+                and parse_release(result.title).covers(season, episode)
+            ]
+            if results:
+                return results
+
+        normalized_query = f"{normalize_name(show_name)} S{season:02}E{episode:02}"
+        # A single resolution can still narrow the query itself
+        if len(self.resolutions) == 1:
+            normalized_query += f" {self.resolutions[0]}"
+        results = self.search_indexer(indexer, {'t': 'search', 'q': normalized_query})
+        if failed and not results:
+            return None
+        return results
+
+    def _search_indexers(self, search, indexers):
+        """
+        Yield (indexer, search(indexer)) for each of indexers in priority order
+        In concurrent mode every indexer is queried at once, each with its own
+        deadline, so a slow indexer only delays the results ranked below it.
+        Once the caller stops iterating, queued searches are cancelled and
+        in-flight ones are ignored.
+        """
+        if self.search_mode != 'concurrent' or len(indexers) < 2:
+            for indexer in indexers:
+                logger.debug(f"Trying indexer: {indexer['name']}")
+                yield indexer, search(indexer)
+            return
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=len(self.indexers), thread_name_prefix='indexer'
+            )
+        started = time.monotonic()
+        futures = [
+            self._executor.submit(search, indexer)
+            for indexer in indexers
+        ]
+        try:
+            for indexer, future in zip(indexers, futures):
+                logger.debug(f"Trying indexer: {indexer['name']}")
+                deadline = started + indexer.get('timeout', self.indexer_timeout) * SEARCH_ATTEMPTS
+                try:
+                    results = future.result(timeout=max(0, deadline - time.monotonic()))
+                except FutureTimeoutError:
+                    logger.warning(f"Giving up on {indexer['name']}: no response within its deadline")
+                    results = None
+                yield indexer, results
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def parse_nzbgeek_results(self, xml_data):
+        """Parse NZBGeek XML results from text or a stream, stopping at max_results"""
+        return list(iter_results(xml_data, self.max_results))
     
-    def send_to_nzbget(self, nzb_name, nzb_content):
-        """Send NZB to NZBGet"""
-        headers = {"Content-Type": "application/json"}
-        
+    def _append_params(self, nzb_name, content):
+        """Build the params of NZBGet's append for an NZB given as base64 or as a URL"""
         # Add timestamp to make DupeKey unique
-        import time
         unique_key = f"{nzb_name}_{int(time.time())}"
-        
-        payload = {
-            "method": "append",
-            "params": [
-                nzb_name,  # NZBFilename
-                base64.b64encode(nzb_content).decode("utf-8"),  # NZBContent
-                "Series",  # Category
-                0,  # Priority
-                False,  # Add to top
-                False,  # Add paused
-                unique_key,  # DupeKey - Now unique for each attempt
-                0,  # DupeScore
-                "FORCE",  # DupeMode - Changed from "SCORE" to "FORCE"
-                [],  # Post-process parameters
-            ],
-        }
-
-        response = requests.post(
-            self.nzbget_url,
-            json=payload,
-            auth=(self.nzbget_username, self.nzbget_password),
-            headers=headers
+        return [
+            nzb_name,  # NZBFilename
+            content,  # NZBContent, base64 or a URL for NZBGet to fetch
+            "Series",  # Category
+            0,  # Priority
+            False,  # Add to top
+            False,  # Add paused
+            unique_key,  # DupeKey - Now unique for each attempt
+            0,  # DupeScore
+            "FORCE",  # DupeMode - Changed from "SCORE" to "FORCE"
+            [],  # Post-process parameters
+        ]
+
+    def _spool_nzb_payload(self, nzb_name, nzb_url, timeout):
+        """
+        Stream an NZB from the indexer straight into an append request body
+        The NZB is base64-encoded chunk by chunk into a spooled temporary file,
+        so memory use stays flat however large it is. Gzipped NZBs are
+        decompressed on the way.
+        """
+        request = self.nzbget.request("append", self._append_params(nzb_name, NZB_PLACEHOLDER))
+        head, tail = json.dumps(request).split(
+            json.dumps(NZB_PLACEHOLDER)
         )
-        response.raise_for_status()
-        result = response.json()
-        
-        if result.get("result"):
-            print(f"Successfully sent '{nzb_name}' to NZBGet.")
+        body = tempfile.SpooledTemporaryFile(max_size=NZB_SPOOL_SIZE)
+        try:
+            with self.session.get(nzb_url, timeout=timeout, stream=True) as response:
+                response.raise_for_status()
+                length = int(response.headers.get("Content-Length") or 0)
+                if length > self.nzb_max_size:
+                    raise ValueError(f"NZB is {length / MB:.1f} MB, over the size limit")
+
+                body.write(head.encode() + b'"')
+                decompressor = None
+                pending = b""
+                size = 0
+                for chunk in response.iter_content(NZB_CHUNK_SIZE):
+                    if size == 0 and decompressor is None and chunk[:2] == GZIP_MAGIC:
+                        decompressor = zlib.decompressobj(wbits=31)
+                    pieces = _inflate(decompressor, chunk) if decompressor else (chunk,)
+                    for piece in pieces:
+                        size += len(piece)
+                        if size > self.nzb_max_size:
+                            raise ValueError("NZB is over the size limit")
+                        # Encode whole 3-byte groups so no padding lands mid-stream
+                        pending += piece
+                        usable = len(pending) - len(pending) % 3
+                        body.write(base64.b64encode(pending[:usable]))
+                        pending = pending[usable:]
+                if decompressor:
+                    pending += decompressor.flush()
+                body.write(base64.b64encode(pending) + b'"' + tail.encode())
+            small = body.tell() <= NZB_SPOOL_SIZE
+            body.seek(0)
+            if small:
+                # Still in memory; sending the bytes avoids a rollover to disk
+                data = body.read()
+                body.close()
+                return data
+            return body
+        except BaseException:
+            body.close()
+            raise
+
+    @staticmethod
+    def _append(call, *args):
+        """Make an append call, raising NZBGetUnavailable if NZBGet can't be reached"""
+        try:
+            return call("append", *args)
+        except requests.RequestException as e:
+            raise NZBGetUnavailable(f"NZBGet unavailable: {e}") from e
+
+    def send_to_nzbget(self, nzb_name, nzb_url, timeout=None):
+        """
+        Send a release to NZBGet
+        With NZB_HANDOFF "url" NZBGet fetches the NZB from the indexer itself,
+        otherwise the NZB is streamed through this process.
+        Returns False when the release itself is bad: the indexer refused the
+        NZB, or it was oversized, corrupt or rejected by NZBGet. Raises
+        NZBGetUnavailable when NZBGet can't be reached, and lets other
+        requests errors of the indexer through, as neither is the release's fault.
+        """
+        if self.nzb_handoff == "url":
+            try:
+                nzb_id = self._append(self.nzbget.call, *self._append_params(nzb_name, nzb_url))
+            except ValueError as e:
+                logger.error(f"Failed to send '{nzb_name}' to NZBGet: {e}")
+                return False
+        else:
+            try:
+                body = self._spool_nzb_payload(nzb_name, nzb_url, timeout or self.indexer_timeout)
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code >= 500:
+                    raise
+                logger.error(f"Failed to fetch '{nzb_name}': {e}")
+                return False
+            except (ValueError, zlib.error) as e:
+                logger.error(f"Failed to fetch '{nzb_name}': {e}")
+                return False
+            try:
+                nzb_id = self._append(self.nzbget.call_with_body, body)
+            except ValueError as e:
+                logger.error(f"Failed to send '{nzb_name}' to NZBGet: {e}")
+                return False
+            finally:
+                if not isinstance(body, bytes):
+                    body.close()
+
+        if nzb_id and nzb_id > 0:
+            logger.info(f"Successfully sent '{nzb_name}' to NZBGet.")
+            parsed = parse_release(nzb_name)
+            if parsed and parsed.season is not None:
+                for episode in parsed.episodes:
+                    self._get_nzbget_active_downloads().add(
+                        parsed.show, parsed.season, episode, nzb_name
+                    )
             return True
         else:
-            print(f"Failed to send '{nzb_name}' to NZBGet: {result.get('error', 'Unknown error')}")
+            logger.error(f"Failed to send '{nzb_name}' to NZBGet: append returned {nzb_id}")
             return False
 
-    def find_and_download_episode(self, show_name, season, episode, resolution):
-        """Search for and download a specific episode"""
-        normalized_query = f"{normalize_name(show_name)} S{season:02}E{episode:02} {resolution}"
+    def find_and_download_episode(self, show_name, season, episode,
+                                  show_ids=None, whole_season=False):
+        """
+        Search for and download a specific episode
+        Every indexer is searched once for all resolutions, and the releases
+        found are ranked together so the best one is grabbed first.
+        """
 
         # Check active downloads first
-        active_downloads = self._get_nzbget_active_downloads()
-        for download in active_downloads:
-            if (download['season'] == season and 
-                download['episode'] == episode and 
-                is_similar(normalize_name(show_name), 
-                         normalize_name(download['show_name']))[0]):
-                print(f"Skipping - episode already downloading: {download['full_name']}")
-                return True
-
-        # Try each enabled indexer in priority order
-        for indexer in self.indexers:
-            print(f"\nTrying indexer: {indexer['name']}")
-            xml_data = self.search_indexer(indexer, normalized_query)
-            
-            if not xml_data:
-                continue
-                
-            results = self.parse_nzbgeek_results(xml_data)  # Can keep same parser as it's standard Newznab XML
-
-            for nzb_data in results:
-                nzb_title = nzb_data["title"]
-                similar, _ = is_similar(normalize_name(show_name), 
-                                      normalize_name(nzb_title.split('.S')[0]))
-                
-                if similar:
-                    print(f"Found matching release on {indexer['name']}: {nzb_title}")
-                    try:
-                        nzb_content = requests.get(nzb_data["nzb_url"]).content
-                        if self.send_to_nzbget(nzb_title + ".nzb", nzb_content):
-                            return True
-                    except Exception as e:
-                        print(f"Error downloading from {indexer['name']}: {e}")
+        download = self._get_nzbget_active_downloads().find(show_name, season, episode)
+        if download:
+            logger.debug(f"Skipping - episode already downloading: {download}")
+            return True
+
+        if self._nzbget_unavailable:
+            return False
+
+        # Recent grabs and searches that found nothing need no network work
+        show_key = normalize_name(show_name)
+        reason = self.history.should_skip(show_key, season, episode)
+        if reason:
+            logger.debug(f"Skipping - {reason}")
+            return False
+
+        def search(indexer):
+            return self._search_episode(
+                indexer, show_name, season, episode, show_ids, whole_season
+            )
+
+        indexer_ranks = {indexer['name']: rank for rank, indexer in enumerate(self.indexers)}
+        tried = set()
+        # Set when a search, an NZB fetch or NZBGet failed, so finding nothing
+        # may not mean there is nothing to find
+        errored = False
+        pending = self.indexers
+        while pending:
+            # Gather releases from indexers in priority order. Once one offers
+            # a usable release in the preferred resolution, lower-priority
+            # indexers can't beat it on resolution or priority, so their
+            # searches are abandoned until every release found has failed.
+            found = []
+            searched = set()
+            with phase("indexer search"):
+                for indexer, results in self._search_indexers(search, pending):
+                    searched.add(indexer['name'])
+                    if results is None:
+                        errored = True
+                        continue
+                    usable = [result for result in results or []
+                              if not self._is_blocked(result)]
+                    if not usable:
                         continue
+                    found.append((indexer_ranks[indexer['name']], indexer, usable))
+                    if any(c.resolution_rank == 0 for c in rank_releases(
+                            show_name, season, episode, [found[-1]], self.resolutions, len(self.indexers))):
+                        break
+            pending = [indexer for indexer in pending if indexer['name'] not in searched]
+
+            candidates = rank_releases(show_name, season, episode, found, self.resolutions, len(self.indexers))
+            for candidate in candidates:
+                indexer = candidate.indexer
+                nzb_title = candidate.result.title
+                guid = candidate.result.guid or candidate.result.nzb_url
+                if guid in tried:
+                    continue
+                tried.add(guid)
+                logger.info(f"Best matching release on {indexer['name']}: {nzb_title} (score {candidate.score:.2f})")
+                try:
+                    with phase("grab"):
+                        sent = self.send_to_nzbget(
+                            nzb_title + ".nzb", candidate.result.nzb_url,
+                            timeout=indexer.get('timeout', self.indexer_timeout)
+                        )
+                except NZBGetUnavailable as e:
+                    # Every other release would fail the same way, and none is to blame
+                    logger.error(f"{e}, not sending any more releases this run")
+                    self._nzbget_unavailable = True
+                    return False
+                except requests.RequestException as e:
+                    logger.warning(f"Error downloading from {indexer['name']}: {e}")
+                    errored = True
+                    continue
+                self.history.record(guid, indexer['name'], nzb_title, show_key, season, episode,
+                                    SENT if sent else FAILED)
+                if sent:
+                    return True
 
+        if errored:
+            # Errors are not held against the episode; it is searched again next run
+            logger.info(f"No release grabbed for {show_name} S{season:02}E{episode:02} "
+                        f"because of errors, trying again next run")
+            return False
+        if not tried:
+            logger.info(f"No matching release found for {show_name} S{season:02}E{episode:02}")
+        self.history.record_miss(show_key, season, episode)
         return False
 
+    def _is_blocked(self, result):
+        if self.history.is_blocked(result.guid or result.nzb_url):
+            logger.debug(f"Skipping blocklisted release: {result.title}")
+            return True
+        return False
+
+    def close(self):
+        """Release the search threads, connections and cache"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.session.close()
+        if self.search_cache:
+            self.search_cache.close()
+        self.history.close()
+        self.nzbget.close()
+
     def run(self):
         """Run the complete download process"""
-        print("Starting download process...")
-        shows = get_shows_in_collection()
-        
+        logger.info("Starting download process...")
+        self._active_downloads = None
+        self._nzbget_unavailable = False
+        self._indexes_fresh = False
+        # Capabilities are remembered for one run; the search cache keeps them for CAPS_TTL
+        self._caps = {}
+        with phase("trakt sync"):
+            shows = get_shows_in_collection()
+            self.sync.begin()
+
+        next_episodes = {}
         for show in shows:
-            self.process_show(show)
-        
-        print("Download process complete!")
+            next_episodes[show["show"]["ids"]["trakt"]] = self.process_show(show)
+        self.sync.save()
+
+        # Let the organizer reuse this run's Trakt work
+        save_wanted_snapshot(shows, next_episodes)
+        logger.info("Download process complete!")
 
 
 if __name__ == "__main__":
+    setup_logging(settings['LOG_LEVEL'])
     downloader = ShowDownloader()
     downloader.run()
+    log_summary()
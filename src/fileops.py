@@ -0,0 +1,158 @@
+import errno
+import logging
+import os
+import shutil
+import stat
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def _same_device(src, dest_dir):
+    try:
+        return os.stat(src).st_dev == os.stat(dest_dir).st_dev
+    except OSError:
+        return False
+
+
+def _copy_file(src, dst, chunk_size):
+    """
+    Copy src to dst through a temporary file, flushed to disk and checked
+    against the source size before it replaces dst
+    """
+    tmp_path = f"{dst}.part"
+    try:
+        with open(src, "rb") as fsrc, open(tmp_path, "wb") as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            buffer = bytearray(chunk_size)
+            view = memoryview(buffer)
+            while True:
+                read = fsrc.readinto(buffer)
+                if not read:
+                    break
+                fdst.write(view[:read])
+            fdst.flush()
+            os.fsync(fdst.fileno())
+            copied = os.fstat(fdst.fileno()).st_size
+        if copied != size:
+            raise OSError(f"copied {copied} of {size} bytes")
+        try:
+            shutil.copystat(src, tmp_path)
+        except OSError:
+            # Timestamps and modes are not supported by every filesystem (e.g. FAT)
+            pass
+        os.replace(tmp_path, dst)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return size
+
+
+def _remove_readonly(func, path, exc_info):
+    """Make a path writable and retry, like rm -rf would"""
+    os.chmod(path, stat.S_IWRITE | stat.S_IREAD | stat.S_IEXEC)
+    func(path)
+
+
+class FileOps:
+    """
+    Queued file moves and folder deletions, run together by flush()
+    Moves within a device are a single os.rename. Moves across devices are
+    chunked copies, fsynced and size-checked before the source is removed,
+    run in a pool of FILEOPS_WORKERS threads. Deletions run after the moves
+    and in-process, skipping any folder that still holds a file that failed
+    to move.
+    """
+    def __init__(self):
+        self.workers = settings["FILEOPS_WORKERS"]
+        self.chunk_size = settings["FILEOPS_CHUNK_MB"] * MB
+        self._moves = []
+        self._deletions = []
+
+    def move(self, src, dst):
+        self._moves.append((src, dst))
+
+    def delete_tree(self, path):
+        self._deletions.append(path)
+
+    def _move(self, src, dst):
+        """Move one file, returning (bytes, whether it was copied)"""
+        size = os.stat(src).st_size
+        if _same_device(src, os.path.dirname(dst)):
+            try:
+                os.rename(src, dst)
+                return size, False
+            except OSError as e:
+                # Bind mounts can share a device number yet refuse renames
+                if e.errno != errno.EXDEV:
+                    raise
+        size = _copy_file(src, dst, self.chunk_size)
+        os.remove(src)
+        return size, True
+
+    def _run_moves(self, moves):
+        failed = []
+        moved_bytes = renamed = copied = 0
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+            futures = [(src, dst, executor.submit(self._move, src, dst)) for src, dst in moves]
+            for src, dst, future in futures:
+                try:
+                    size, was_copied = future.result()
+                except Exception as e:
+                    logger.error(f"Error moving {src} -> {dst}: {e}")
+                    failed.append(src)
+                    continue
+                moved_bytes += size
+                copied += was_copied
+                renamed += not was_copied
+        return failed, moved_bytes, renamed, copied
+
+    def _run_deletions(self, deletions, keep):
+        deleted = 0
+        # Deleting a folder also deletes everything queued below it
+        deletions = sorted(set(deletions))
+        roots = [path for i, path in enumerate(deletions)
+                 if not any(path.startswith(parent + os.sep) for parent in deletions[:i])]
+        for path in roots:
+            if any(src.startswith(path + os.sep) for src in keep):
+                logger.warning(f"Keeping {path}, it holds a file that could not be moved")
+                continue
+            try:
+                if sys.version_info >= (3, 12):
+                    shutil.rmtree(path, onexc=_remove_readonly)
+                else:
+                    shutil.rmtree(path, onerror=_remove_readonly)
+                deleted += 1
+                logger.debug(f"Successfully deleted folder and contents: {path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Error removing folder {path}: {e}")
+        return deleted
+
+    def flush(self):
+        """Run all queued operations, returning the sources of failed moves"""
+        # A later move to the same destination overwrites an earlier one anyway
+        moves = list({dst: (src, dst) for src, dst in self._moves}.values())
+        self._moves = []
+        deletions, self._deletions = self._deletions, []
+        failed = []
+        if moves:
+            started = time.monotonic()
+            failed, moved_bytes, renamed, copied = self._run_moves(moves)
+            elapsed = time.monotonic() - started
+            logger.info(f"Moved {renamed + copied} files ({moved_bytes / MB:.1f} MB, "
+                        f"{renamed} renamed, {copied} copied) in {elapsed:.2f}s")
+        if deletions:
+            started = time.monotonic()
+            deleted = self._run_deletions(deletions, failed)
+            logger.info(f"Deleted {deleted} folders in {time.monotonic() - started:.2f}s")
+        return failed
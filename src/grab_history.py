@@ -0,0 +1,140 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SENT = "sent"
+FAILED = "failed"
+
+
+class GrabHistory:
+    """
+    Persistent record of grabbed releases and of searches that found nothing
+    Releases the indexer refused or NZBGet rejected or failed, or that never
+    showed up after being sent, are blocklisted by guid. Episodes without a
+    usable release get a next-attempt time that backs off exponentially between
+    retry_base and retry_max seconds.
+    """
+    def __init__(self, path, regrab_after, retry_base, retry_max):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.regrab_after = regrab_after
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS grabs ("
+            " guid TEXT, indexer TEXT, title TEXT, show_key TEXT, season INTEGER,"
+            " episode INTEGER, grabbed_at REAL, outcome TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS grabs_episode ON grabs (show_key, season, episode)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS grabs_guid ON grabs (guid)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS attempts ("
+            " show_key TEXT, season INTEGER, episode INTEGER, failures INTEGER,"
+            " next_attempt REAL, PRIMARY KEY (show_key, season, episode))"
+        )
+
+    def last_grab(self, show_key, season, episode):
+        """Return (guid, title, grabbed_at) of the latest successful grab, or None"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT guid, title, grabbed_at FROM grabs"
+                " WHERE show_key = ? AND season = ? AND episode = ? AND outcome = ?"
+                " ORDER BY grabbed_at DESC LIMIT 1",
+                (show_key, season, episode, SENT),
+            ).fetchone()
+
+    def should_skip(self, show_key, season, episode):
+        """
+        Decide before any network work whether to search for an episode
+        Returns a reason to skip it, or None to go ahead. A grab that is older
+        than regrab_after while the episode is still missing is taken to have
+        failed, and its release is blocklisted.
+        """
+        now = time.time()
+        grab = self.last_grab(show_key, season, episode)
+        if grab:
+            guid, title, grabbed_at = grab
+            if now - grabbed_at < self.regrab_after:
+                return f"grabbed {title} {(now - grabbed_at) / 60:.0f} minutes ago"
+            logger.info(f"Earlier grab {title} never arrived, blocklisting it")
+            self.block(guid)
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT next_attempt FROM attempts WHERE show_key = ? AND season = ? AND episode = ?",
+                (show_key, season, episode),
+            ).fetchone()
+        if row and row[0] > now:
+            return f"no release found earlier, next search in {(row[0] - now) / 60:.0f} minutes"
+        return None
+
+    def is_blocked(self, guid):
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM grabs WHERE guid = ? AND outcome = ? LIMIT 1", (guid, FAILED)
+            ).fetchone() is not None
+
+    def block(self, guid):
+        """Blocklist a release so it is not grabbed again"""
+        with self._lock:
+            self._db.execute("UPDATE grabs SET outcome = ? WHERE guid = ?", (FAILED, guid))
+
+    def block_title(self, title):
+        """Blocklist a sent release by name, e.g. when NZBGet reports it failed"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE grabs SET outcome = ? WHERE title = ? AND outcome = ?", (FAILED, title, SENT)
+            )
+
+    def record(self, guid, indexer, title, show_key, season, episode, outcome):
+        """Record a grab attempt; a successful one clears the episode's backoff"""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO grabs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (guid, indexer, title, show_key, season, episode, time.time(), outcome),
+            )
+            if outcome == SENT:
+                self._db.execute(
+                    "DELETE FROM attempts WHERE show_key = ? AND season = ? AND episode = ?",
+                    (show_key, season, episode),
+                )
+
+    def record_miss(self, show_key, season, episode):
+        """Back off searching for an episode that had no usable release"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT failures FROM attempts WHERE show_key = ? AND season = ? AND episode = ?",
+                (show_key, season, episode),
+            ).fetchone()
+            failures = (row[0] if row else 0) + 1
+            delay = min(self.retry_base * 2 ** (failures - 1), self.retry_max)
+            self._db.execute(
+                "INSERT OR REPLACE INTO attempts VALUES (?, ?, ?, ?, ?)",
+                (show_key, season, episode, failures, time.time() + delay),
+            )
+        logger.info(f"Next search for this episode in {delay / 60:.0f} minutes")
+
+    def summary(self, since):
+        """Count releases sent since a timestamp, blocklisted releases and episodes backing off"""
+        with self._lock:
+            sent = self._db.execute(
+                "SELECT COUNT(*) FROM grabs WHERE outcome = ? AND grabbed_at >= ?", (SENT, since)
+            ).fetchone()[0]
+            blocked = self._db.execute(
+                "SELECT COUNT(DISTINCT guid) FROM grabs WHERE outcome = ?", (FAILED,)
+            ).fetchone()[0]
+            backing_off = self._db.execute(
+                "SELECT COUNT(*) FROM attempts WHERE next_attempt > ?", (time.time(),)
+            ).fetchone()[0]
+        return {"sent": sent, "blocked": blocked, "backing_off": backing_off}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
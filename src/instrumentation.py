@@ -0,0 +1,136 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+# Upper bounds in seconds of the HTTP latency histogram buckets; the last
+# bucket holds everything slower
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class HostStats:
+    """Request count, errors and a latency histogram for one host"""
+    __slots__ = ("requests", "errors", "total", "buckets")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given share of requests"""
+        target = fraction * self.requests
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Stats:
+    """Per-phase timings and per-host HTTP accounting for one run"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # Phase name -> [times entered, total seconds]
+            self.phases = {}
+            self.hosts = {}
+            self.started = time.perf_counter()
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            entry = self.phases.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_request(self, host, status_code, seconds):
+        with self._lock:
+            host_stats = self.hosts.get(host)
+            if host_stats is None:
+                host_stats = self.hosts[host] = HostStats()
+            host_stats.requests += 1
+            host_stats.errors += status_code >= 400
+            host_stats.total += seconds
+            host_stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+
+stats = Stats()
+
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to the named phase"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_phase(name, time.perf_counter() - started)
+
+
+def _record_response(response, *args, **kwargs):
+    stats.add_request(urlsplit(response.url).netloc, response.status_code,
+                      response.elapsed.total_seconds())
+
+
+def instrument_session(session):
+    """Count every response of a requests session in the HTTP stats"""
+    session.hooks["response"].append(_record_response)
+    return session
+
+
+def setup_logging(level="INFO"):
+    """Send log records to stderr with timestamps, levels and module names"""
+    logging.basicConfig(level=getattr(logging, str(level).upper(), logging.INFO),
+                        format=LOG_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
+    # urllib3 logs every new connection at debug level
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+
+def log_summary():
+    """Log where the time of the run went, then start counting afresh"""
+    elapsed = time.perf_counter() - stats.started
+    lines = [f"Run took {elapsed:.2f}s"]
+    for name, (count, total) in sorted(stats.phases.items(), key=lambda item: -item[1][1]):
+        lines.append(f"  {name:<16} {total:8.2f}s  {count:5}x  {total / elapsed * 100 if elapsed else 0:5.1f}%")
+    for host, host_stats in sorted(stats.hosts.items()):
+        mean = host_stats.total / host_stats.requests
+        lines.append(
+            f"  {host:<32} {host_stats.requests:5} requests  {host_stats.errors:3} errors  "
+            f"mean {mean * 1000:6.0f}ms  p50 <={host_stats.percentile(0.5) * 1000:.0f}ms  "
+            f"p95 <={host_stats.percentile(0.95) * 1000:.0f}ms"
+        )
+    logger.info("\n".join(lines))
+    stats.reset()
+
+
+@contextmanager
+def profiled(path):
+    """Profile the block with cProfile, writing pstats data to path if given"""
+    if not path:
+        yield
+        return
+    # Only profiled runs pay for importing the profiler
+    import cProfile
+    import io
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(20)
+        logger.info(f"Profile written to {path}\n{report.getvalue()}")
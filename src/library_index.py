@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import time
+from release_parser import parse_release
+from state_file import write_json
+from utils import EpisodeIndex
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = (".mkv", ".mp4", ".avi")
+INDEX_VERSION = 2
+
+# Directories modified this recently are re-listed on the next refresh, since
+# coarse filesystem timestamps (e.g. FAT on SD cards) can hide a later change
+RACY_MTIME_WINDOW_NS = 2_000_000_000
+
+
+class LibraryIndex:
+    """
+    On-disk index of a TV shows folder mapping (show, season, episode) to paths.
+    Every directory is stored with its mtime so a refresh only re-lists the
+    directories that changed since the previous scan.
+    """
+    def __init__(self, root, index_path, index_folders=False):
+        self.root = root
+        self.index_path = index_path
+        # Also index the names of the top-level folders (used for download folders)
+        self.index_folders = index_folders
+        self._dirs = None
+        self._episodes = EpisodeIndex()
+
+    def _load(self):
+        """Load the stored index, discarding it if it belongs to another root"""
+        self._dirs = {}
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable library index {self.index_path}: {e}")
+            return
+        if data.get("version") == INDEX_VERSION and data.get("root") == self.root:
+            self._dirs = data.get("dirs", {})
+
+    def save(self):
+        """Write the index to disk atomically, a failure only costs a full scan next time"""
+        write_json(self.index_path, {"version": INDEX_VERSION, "root": self.root, "dirs": self._dirs})
+
+    def _parse(self, name):
+        """Return [name, show, season, episodes], or [name] if it holds no episode"""
+        parsed = parse_release(name)
+        if not parsed or parsed.season is None:
+            return [name]
+        return [name, parsed.show, parsed.season, list(parsed.episodes)]
+
+    def _list_dir(self, path, mtime):
+        """List a single directory, recording video files and subdirectories"""
+        files, subdirs, others = [], [], 0
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.name.endswith(VIDEO_EXTENSIONS):
+                    files.append(self._parse(entry.name))
+                else:
+                    others += 1
+
+        if self.index_folders and path == self.root:
+            folders = [self._parse(name) for name in subdirs]
+        else:
+            folders = []
+
+        if time.time_ns() - mtime < RACY_MTIME_WINDOW_NS:
+            mtime = None
+        return {"mtime": mtime, "files": files, "subdirs": subdirs,
+                "folders": folders, "others": others}
+
+    def refresh(self):
+        """
+        Bring the index up to date with the filesystem
+        Unchanged directories are only stat'ed, never re-listed
+        """
+        if self._dirs is None:
+            self._load()
+
+        dirs = {}
+        relisted = 0
+        stack = [self.root]
+        while stack:
+            path = stack.pop()
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+
+            entry = self._dirs.get(path)
+            if entry is None or entry["mtime"] != mtime:
+                try:
+                    entry = self._list_dir(path, mtime)
+                except OSError as e:
+                    logger.warning(f"Error listing {path}: {e}")
+                    continue
+                relisted += 1
+            dirs[path] = entry
+            stack.extend(os.path.join(path, name) for name in entry["subdirs"])
+
+        changed = relisted or len(dirs) != len(self._dirs)
+        self._dirs = dirs
+        self._build_lookup()
+        if changed:
+            self.save()
+        logger.debug(f"Library index for {self.root}: {len(dirs)} folders, {relisted} rescanned")
+
+    def _build_lookup(self):
+        self._episodes = EpisodeIndex()
+        for path, entry in self._dirs.items():
+            for parsed in entry["files"] + entry["folders"]:
+                if len(parsed) == 4:
+                    name, show_name, season, episodes = parsed
+                    for episode in episodes:
+                        self._episodes.add(show_name, season, episode, os.path.join(path, name))
+
+    def find(self, show_name, season, episode):
+        """Return the path of a file or folder holding this episode, or None"""
+        return self._episodes.find(show_name, season, episode)
+
+    def files(self):
+        """Return the paths of all indexed video files"""
+        return [os.path.join(path, parsed[0])
+                for path, entry in self._dirs.items() for parsed in entry["files"]]
+
+    def directories(self):
+        """Return all indexed directories, deepest first"""
+        return sorted(self._dirs, key=lambda path: path.count(os.sep), reverse=True)
+
+    def is_empty(self, path):
+        """Check whether an indexed directory holds no entries at all"""
+        entry = self._dirs.get(path)
+        return bool(entry) and not (entry["files"] or entry["subdirs"] or entry["others"])
+
+    def forget_file(self, file_path):
+        """Drop a deleted file from the index"""
+        path, name = os.path.split(file_path)
+        entry = self._dirs.get(path)
+        if entry:
+            entry["files"] = [parsed for parsed in entry["files"] if parsed[0] != name]
+            entry["mtime"] = None
+
+    def forget_dir(self, dir_path):
+        """Drop a deleted directory and everything below it from the index"""
+        prefix = dir_path + os.sep
+        for path in [p for p in self._dirs if p == dir_path or p.startswith(prefix)]:
+            del self._dirs[path]
+        parent, name = os.path.split(dir_path)
+        entry = self._dirs.get(parent)
+        if entry:
+            entry["subdirs"] = [d for d in entry["subdirs"] if d != name]
+            entry["folders"] = [parsed for parsed in entry["folders"] if parsed[0] != name]
+            entry["mtime"] = None
@@ -0,0 +1,182 @@
+import logging
+import math
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+from utils import normalize_name
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_THRESHOLD = 0.8
+YEAR_BONUS = 0.1
+
+
+def _bigrams(name):
+    return {name[i:i + 2] for i in range(len(name) - 1)}
+
+
+def _exact_length_limit(threshold):
+    """
+    Longest combined length at which two names could reach threshold
+    without sharing a character bigram
+
+    When every matching block is a single character, consecutive blocks are
+    separated by a gap in at least one name, so len(a) + len(b) >= 3M - 1.
+    Together with ratio = 2M / (len(a) + len(b)) this bounds the combined
+    length of such pairs; longer pairs reaching threshold always share a bigram.
+    """
+    if threshold <= 2 / 3:
+        return float("inf")
+    return math.floor(1 / (1.5 * threshold - 1) + 1e-9)
+
+
+class _Name:
+    """A precomputed normalized name pointing back to its show"""
+    __slots__ = ("normalized", "chars", "show_index", "with_year")
+
+    def __init__(self, normalized, show_index, with_year):
+        self.normalized = normalized
+        self.chars = Counter(normalized)
+        self.show_index = show_index
+        self.with_year = with_year
+
+
+class ShowMatcher:
+    """
+    Fuzzy show-name matcher built once from the Trakt collection
+    Normalized names (with and without year) are indexed by character bigram,
+    so a lookup only runs SequenceMatcher on a shortlist of names that could
+    reach the similarity threshold. The shortlist is lossless, so results are
+    the same as comparing against every show, and they are memoized per input.
+    """
+    def __init__(self, shows):
+        self.shows = shows
+        self._names = []
+        self._by_bigram = {}
+        self._short_names = []
+        self._memo = {}
+
+        for show_index, show in enumerate(shows):
+            title = show["show"]["title"]
+            year = show["show"].get("year")
+            self._add(normalize_name(title), show_index, False)
+            if year:
+                self._add(normalize_name(f"{title} ({year})"), show_index, True)
+        self._short_names.sort()
+
+    def _add(self, normalized, show_index, with_year):
+        name = _Name(normalized, show_index, with_year)
+        name_id = len(self._names)
+        self._names.append(name)
+        for bigram in _bigrams(normalized):
+            self._by_bigram.setdefault(bigram, []).append(name_id)
+        # Names short enough to match without a shared bigram are always checked
+        if len(normalized) <= _exact_length_limit(SIMILARITY_THRESHOLD - YEAR_BONUS):
+            self._short_names.append((len(normalized), name_id))
+
+    def _shortlist(self, normalized, threshold):
+        """Names that may reach threshold, with cheap upper bounds applied"""
+        limit = _exact_length_limit(threshold) - len(normalized)
+        name_ids = set()
+        if limit == float("inf"):
+            name_ids.update(range(len(self._names)))
+        else:
+            for bigram in _bigrams(normalized):
+                name_ids.update(self._by_bigram.get(bigram, ()))
+            for name_length, name_id in self._short_names:
+                if name_length > limit:
+                    break
+                name_ids.add(name_id)
+
+        chars = Counter(normalized)
+        length = len(normalized)
+        for name_id in name_ids:
+            name = self._names[name_id]
+            total = length + len(name.normalized)
+            if not total:
+                continue
+            # Same bounds as SequenceMatcher.real_quick_ratio and quick_ratio
+            if 2 * min(length, len(name.normalized)) / total < threshold:
+                continue
+            if 2 * sum((chars & name.chars).values()) / total < threshold:
+                continue
+            yield name
+
+    def similarities(self, name, threshold=SIMILARITY_THRESHOLD):
+        """
+        Return {show_index: (name_only_similarity, with_year_similarity)} for
+        every show with either similarity at or above threshold
+        """
+        key = (name, threshold)
+        if key in self._memo:
+            return self._memo[key]
+
+        normalized = normalize_name(name)
+        scores = {}
+        for candidate in self._shortlist(normalized, threshold):
+            similarity = SequenceMatcher(None, normalized, candidate.normalized).ratio()
+            if similarity < threshold:
+                continue
+            name_only, with_year = scores.get(candidate.show_index, (0, 0))
+            if candidate.with_year:
+                with_year = similarity
+            else:
+                name_only = similarity
+            scores[candidate.show_index] = (name_only, with_year)
+
+        self._memo[key] = scores
+        return scores
+
+    def matching_shows(self, name):
+        """Return every collection show whose title is similar to name"""
+        return [
+            self.shows[index]
+            for index, (name_only, _) in sorted(self.similarities(name).items())
+            if name_only
+        ]
+
+    def best_match(self, test_name, verbose=True):
+        """
+        Find the best matching show, handling names with or without a year
+        A matching year adds a bonus, so near misses are shortlisted too
+        """
+        year_match = re.search(r"\((\d{4})\)", test_name)
+        test_year = year_match.group(1) if year_match else None
+        clean_test_name = re.sub(r"\s*\(\d{4}\)\s*", "", test_name)
+
+        if verbose:
+            logger.debug(f"Attempting to match: '{test_name}'")
+            logger.debug(f"Normalized test name: '{normalize_name(clean_test_name)}'")
+            if test_year:
+                logger.debug(f"Detected year: {test_year}")
+
+        threshold = SIMILARITY_THRESHOLD - YEAR_BONUS if test_year else SIMILARITY_THRESHOLD
+        best_match = None
+        best_score = 0
+        for show_index, (similarity1, similarity2) in sorted(
+            self.similarities(clean_test_name, threshold).items()
+        ):
+            show = self.shows[show_index]
+            show_year = str(show["show"].get("year", ""))
+            similarity = max(similarity1, similarity2)
+            if verbose:
+                logger.debug(f"Comparing with: '{show['show']['title']}' ({show_year})")
+                logger.debug(
+                    f"Similarity scores - Name only: {similarity1:.2f}, With year: {similarity2:.2f}"
+                )
+            if test_year and test_year == show_year:
+                similarity += YEAR_BONUS
+            if similarity > best_score:
+                best_score = similarity
+                best_match = show
+
+        if best_score >= SIMILARITY_THRESHOLD:
+            if verbose:
+                logger.debug(
+                    f"Final match: '{best_match['show']['title']}' ({best_match['show'].get('year', '')}) with score: {best_score:.2f}"
+                )
+            return best_match
+
+        if verbose:
+            logger.debug(f"No match found with score >= {SIMILARITY_THRESHOLD} (best was: {best_score:.2f})")
+        return None
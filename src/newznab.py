@@ -0,0 +1,104 @@
+import io
+import xml.etree.ElementTree as ET
+from email.utils import parsedate_to_datetime
+
+NEWZNAB_NS = "{http://www.newznab.com/DTD/2010/feeds/attributes/}"
+
+
+class NewznabResult:
+    """A single release from a Newznab feed"""
+    __slots__ = ("title", "nzb_url", "guid", "size", "pubdate", "grabs")
+
+    def __init__(self, title, nzb_url, guid=None, size=None, pubdate=None, grabs=None):
+        self.title = title
+        self.nzb_url = nzb_url
+        self.guid = guid
+        self.size = size  # bytes
+        self.pubdate = pubdate  # unix timestamp
+        self.grabs = grabs
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __repr__(self):
+        return f"NewznabResult({self.title!r})"
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_timestamp(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def iter_results(source, max_results=None):
+    """
+    Incrementally parse a Newznab RSS feed, yielding NewznabResult records
+    source is a file-like object (such as a streamed response) or XML text.
+    Parsing stops as soon as max_results items have been read, and each item
+    is discarded once converted, so memory stays flat for large feeds.
+    Raises ValueError if the indexer answered with a Newznab <error>.
+    """
+    if isinstance(source, (str, bytes)):
+        source = io.BytesIO(source.encode("utf-8") if isinstance(source, str) else source)
+
+    count = 0
+    channel = None
+    in_item = False
+    fields = {}
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if elem.tag == "error":
+                raise ValueError(
+                    f"Indexer error {elem.get('code')}: {elem.get('description')}"
+                )
+            if elem.tag == "channel":
+                channel = elem
+            elif elem.tag == "item":
+                in_item = True
+                fields = {}
+            continue
+
+        if not in_item:
+            continue
+        tag = elem.tag
+        if tag == "title":
+            fields["title"] = elem.text
+        elif tag == "link":
+            fields["nzb_url"] = elem.text
+        elif tag == "guid":
+            fields.setdefault("guid", elem.text)
+        elif tag == "pubDate":
+            fields.setdefault("pubdate", _to_timestamp(elem.text))
+        elif tag == "enclosure":
+            fields.setdefault("size", _to_int(elem.get("length")))
+        elif tag == f"{NEWZNAB_NS}attr":
+            name, value = elem.get("name"), elem.get("value")
+            if name == "size":
+                fields["size"] = _to_int(value)
+            elif name == "grabs":
+                fields["grabs"] = _to_int(value)
+            elif name == "guid":
+                fields["guid"] = value
+            elif name == "usenetdate" and "pubdate" not in fields:
+                fields["pubdate"] = _to_timestamp(value)
+        elif tag == "item":
+            in_item = False
+            if channel is not None:
+                channel.remove(elem)
+            if fields.get("title") and fields.get("nzb_url"):
+                yield NewznabResult(**fields)
+                count += 1
+                if max_results is not None and count >= max_results:
+                    return
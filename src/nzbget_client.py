@@ -0,0 +1,75 @@
+import itertools
+import json
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from instrumentation import instrument_session
+
+logger = logging.getLogger(__name__)
+
+
+class NZBGetUnavailable(Exception):
+    """NZBGet could not be reached or answered with an HTTP error"""
+
+
+class NZBGetClient:
+    """
+    NZBGet JSON-RPC client with a keep-alive session and timeouts
+    batch() sends several calls in one round trip. Servers that don't accept
+    JSON-RPC batches get the calls one at a time instead.
+    """
+    def __init__(self, url, username, password, timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self.session = instrument_session(requests.Session())
+        self.session.auth = (username, password)
+        self.session.headers["Content-Type"] = "application/json"
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=2))
+        self._ids = itertools.count(1)
+        self._batch_supported = True
+
+    def request(self, method, params):
+        """Build a JSON-RPC request object"""
+        return {"jsonrpc": "2.0", "method": method, "params": params, "id": next(self._ids)}
+
+    def send(self, body):
+        """Post an encoded request body (bytes or a file) and return the decoded reply"""
+        response = self.session.post(self.url, data=body, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _result(method, reply):
+        if reply.get("error"):
+            error = reply["error"]
+            message = error.get("message", error) if isinstance(error, dict) else error
+            raise ValueError(f"NZBGet {method} failed: {message}")
+        return reply.get("result")
+
+    def call(self, method, *params):
+        """Call a single method and return its result"""
+        return self.call_with_body(method, json.dumps(self.request(method, list(params))).encode("utf-8"))
+
+    def call_with_body(self, method, body):
+        """Send a request for method that was already encoded, e.g. spooled to a file"""
+        return self._result(method, self.send(body))
+
+    def batch(self, calls):
+        """Call several (method, params) pairs in one round trip, returning their results"""
+        if self._batch_supported and len(calls) > 1:
+            batch_requests = [self.request(method, list(params)) for method, params in calls]
+            try:
+                replies = self.send(json.dumps(batch_requests).encode("utf-8"))
+            except (requests.HTTPError, ValueError):
+                replies = None
+            if isinstance(replies, list):
+                by_id = {reply.get("id"): reply for reply in replies}
+                return [self._result(request["method"], by_id.get(request["id"], {}))
+                        for request in batch_requests]
+            logger.warning("NZBGet does not accept batched calls, sending them one at a time")
+            self._batch_supported = False
+        return [self.call(method, *params) for method, params in calls]
+
+    def close(self):
+        self.session.close()
@@ -1,44 +1,102 @@
+import logging
 import os
-import shutil
-import re
 from config import settings
-from utils import (
-    normalize_name, is_similar, get_shows_in_collection,
-    get_last_watched_and_next_episodes, sanitize_filename
-)
+from fileops import FileOps
+from instrumentation import log_summary, phase, setup_logging
+from library_index import LibraryIndex
+from matcher import ShowMatcher
+from release_parser import parse_release
+from snapshot import load_wanted_snapshot
+from trakt_sync import IncrementalSync
+from utils import normalize_name, get_shows_in_collection, sanitize_filename
+
+logger = logging.getLogger(__name__)
 
 class VideoOrganizer:
-    def __init__(self):
+    def __init__(self, snapshot_max_age=None):
+        self.snapshot_max_age = snapshot_max_age
         self.media_path = settings['MEDIA_LIBRARY_TV_SHOWS_PATH']
         self.unorganized_path = settings['UNORGANIZED_TV_SHOWS_PATH']
-        self.shows = get_shows_in_collection()
-        self.next_episodes = self._get_all_next_episodes()
+        self.library = LibraryIndex(
+            self.media_path, os.path.join(settings['DATA_PATH'], 'library_index.json')
+        )
+        self.fileops = FileOps()
+        self.load_wanted()
+
+    def load_wanted(self):
+        """Load the collection and wanted episodes, from the snapshot if it is fresh"""
+        snapshot = load_wanted_snapshot(self.snapshot_max_age)
+        if snapshot:
+            # Reuse the downloader's recent Trakt results without network calls
+            self.shows, next_episodes = snapshot
+            self.next_episodes = [
+                episode
+                for show in self.shows
+                for episode in self._wanted_episodes(
+                    show, next_episodes.get(str(show["show"]["ids"]["trakt"]))
+                )
+            ]
+        else:
+            with phase("trakt sync"):
+                self.shows = get_shows_in_collection()
+                self.next_episodes = self._get_all_next_episodes()
+        self.matcher = ShowMatcher(self.shows)
+        self._build_wanted_index()
+
+    def _build_wanted_index(self):
+        """
+        Index wanted episodes by (show key, season, episode), where the show
+        key is the normalized Trakt title, and map show keys to show data
+        """
+        self.show_by_key = {}
+        for show in self.shows:
+            self.show_by_key.setdefault(normalize_name(show["show"]["title"]), show)
+        self.wanted = {}
+        for next_ep in self.next_episodes:
+            key = (normalize_name(next_ep["show_name"]), next_ep["season"], next_ep["episode"])
+            self.wanted.setdefault(key, next_ep)
+
+    def _find_wanted(self, show_key, parsed):
+        """Return the first wanted entry among the parsed episodes, or None"""
+        for episode in parsed.episodes:
+            next_ep = self.wanted.get((show_key, parsed.season, episode))
+            if next_ep:
+                return next_ep
+        return None
 
     def _get_all_next_episodes(self):
         """Get next episodes for all shows in collection"""
-        print("Gathering information about next episodes to watch...")
+        logger.info("Gathering information about next episodes to watch...")
+        sync = IncrementalSync()
+        sync.begin()
         episodes = []
         for show in self.shows:
             show_name = show["show"]["title"]
-            show_slug = show["show"]["ids"]["slug"]
-            print(f"\nProcessing show: {show_name}")
-            last_watched, next_eps = get_last_watched_and_next_episodes(show_slug, verbose=True)
+            logger.debug(f"Processing show: {show_name}")
+            last_watched, next_eps = sync.next_episodes(show, verbose=True)
             if next_eps:
-                for ep in next_eps:
-                    episodes.append({
-                        "show_name": show_name,
-                        "season": ep["season"],
-                        "episode": ep["number"],
-                        "show_data": show["show"]
-                    })
+                episodes.extend(self._wanted_episodes(show, next_eps))
                 if last_watched:
-                    print("Next episodes to watch:")
+                    logger.debug("Next episodes to watch:")
                     for ep in next_eps:
-                        print(f"S{ep['season']:02}E{ep['number']:02} - {ep['title']}")
-        print("\nFinished gathering episode information.")
+                        logger.debug(f"S{ep['season']:02}E{ep['number']:02} - {ep['title']}")
+        sync.save()
+        logger.info("Finished gathering episode information.")
         return episodes
 
 
+    def _wanted_episodes(self, show, next_eps):
+        """Turn a show's next episodes into wanted-episode entries"""
+        return [
+            {
+                "show_name": show["show"]["title"],
+                "season": ep["season"],
+                "episode": ep["number"],
+                "show_data": show["show"]
+            }
+            for ep in next_eps or []
+        ]
+
     def _construct_show_folder_name(self, show_data):
         """Create standardized show folder name with year"""
         name = show_data["title"]
@@ -49,165 +107,172 @@ class VideoOrganizer:
         return clean_name
 
     def _parse_episode_info(self, folder_name):
-        """Extract show name, season, and episode from folder name"""
-        match = re.match(r"(.+?)\.S(\d{2})E(\d{2})\.(.+)", folder_name, re.IGNORECASE)
-        if match:
-            return match.groups()
+        """
+        Parse a folder or file name into a ParsedRelease
+        Returns None unless it names a season and episode
+        """
+        parsed = parse_release(folder_name)
+        if parsed and parsed.season is not None:
+            return parsed
         return None
 
     def organize_unorganized(self):
         """Process files in unorganized folder"""
         if not os.path.exists(self.unorganized_path):
-            print(f"Error: Unorganized path does not exist: {self.unorganized_path}")
+            logger.error(f"Unorganized path does not exist: {self.unorganized_path}")
             return
 
-        print("\nScanning unorganized folders:")
-        for root, _, files in os.walk(self.unorganized_path, topdown=False):
+        logger.debug("Scanning unorganized folders:")
+        self._organize_tree(self.unorganized_path)
+
+    def organize_one(self, path):
+        """
+        Organize a single finished download, such as the directory NZBGet
+        just completed, without scanning the rest of the unorganized folder
+        Returns True if any episode was moved into the library. Folders that
+        don't match are left for the full organizer, as the wanted list may
+        predate the downloader run that grabbed them.
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        unorganized = os.path.abspath(self.unorganized_path)
+        if os.path.commonpath([path, unorganized]) != unorganized or path == unorganized:
+            logger.error(f"{path} is not inside the unorganized path {unorganized}")
+            return False
+        if not os.path.isdir(path):
+            logger.error(f"Download directory does not exist: {path}")
+            return False
+        return self._organize_tree(path, delete_rejected=False)
+
+    def _organize_tree(self, top, delete_rejected=True):
+        """
+        Organize every folder below top holding video files
+        Folders that can't be matched are deleted if delete_rejected is set
+        """
+        moved = False
+        for root, _, files in os.walk(top, topdown=False):
             video_files = [f for f in files if f.endswith((".mkv", ".mp4", ".avi"))]
-            if not video_files:
-                continue
-
-            folder_name = os.path.basename(root)
-            print(f"\nProcessing folder: {folder_name}")
-            
-            # Extract show name and episode info from folder name
-            match = re.search(r"(.+?)\.S(\d{2})E(\d{2})", folder_name)
-            if not match:
-                print(f"Skipping: Could not parse episode information from folder name: {folder_name}")
-                if root != self.unorganized_path:
-                    print(f"Removing folder with invalid name format: {root}")
-                    self._force_delete_folder(root)
-                continue
-
-            show_name, season, episode = match.groups()
-            season = int(season)
-            episode = int(episode)
-            
-            # Remove year if present for matching purposes
-            show_name = re.sub(r"\s*\(\d{4}\)|\.\d{4}", "", show_name)
-            show_name = show_name.replace(".", " ").strip()
-
-            print(f"Extracted info - Show: '{show_name}', S{season:02}E{episode:02}")
-
-            # Try to match with next episodes
-            episode_match = None
-            matched_show = None
-            
-            for next_ep in self.next_episodes:
-                trakt_show_name = next_ep["show_name"]
-                # First find matching show using similarity
-                similar, similarity = is_similar(normalize_name(show_name), 
-                                            normalize_name(trakt_show_name))
-                
-                if similar and next_ep["season"] == season and next_ep["episode"] == episode:
-                    print(f"Found matching episode: {trakt_show_name} S{season:02}E{episode:02}")
-                    episode_match = next_ep
-                    # Find the full show data from our collection
-                    for show in self.shows:
-                        if show["show"]["title"] == trakt_show_name:
-                            matched_show = show
-                            break
-                    break
-
-            if not episode_match or not matched_show:
-                print(f"No matching upcoming episode found for: {folder_name}")
-                if root != self.unorganized_path:
-                    print(f"Removing unmatched folder: {root}")
-                    self._force_delete_folder(root)
-                continue
-
-            # Construct destination path
-            show_folder = self._construct_show_folder_name(matched_show["show"])
-            season_folder = f"Season {season:02}"
-            dest_dir = os.path.join(self.media_path, show_folder, season_folder)
-            os.makedirs(dest_dir, exist_ok=True)
-
-            # Move each video file
-            for video_file in video_files:
-                source_path = os.path.join(root, video_file)
-                # Use the folder name as the final filename, but ensure it ends with .mkv
-                final_name = folder_name if folder_name.endswith('.mkv') else f"{folder_name}.mkv"
-                dest_path = os.path.join(dest_dir, final_name)
-                
-                print(f"Moving: {source_path} -> {dest_path}")
-                shutil.move(source_path, dest_path)
-
-            # Clean up source folder after moving files
-            if root != self.unorganized_path:
-                self._force_delete_folder(root)
+            if video_files:
+                moved = self._organize_folder(root, video_files, delete_rejected) or moved
+        # Folders are only deleted once every file queued from them has moved
+        with phase("move"):
+            failed = self.fileops.flush()
+        return moved and not failed
+
+    def _organize_folder(self, root, video_files, delete_rejected=True):
+        """Move the video files of one download folder into the library"""
+        folder_name = os.path.basename(root)
+        logger.debug(f"Processing folder: {folder_name}")
+
+        # Extract show name and episode info from folder name
+        parsed = self._parse_episode_info(folder_name)
+        if not parsed:
+            logger.info(f"Skipping: Could not parse episode information from folder name: {folder_name}")
+            if root != self.unorganized_path and delete_rejected:
+                logger.info(f"Removing folder with invalid name format: {root}")
+                self.fileops.delete_tree(root)
+            return False
+
+        # The parsed show name has any year removed for matching purposes
+        show_name, season, episode = parsed.show, parsed.season, parsed.episode
+
+        logger.debug(f"Extracted info - Show: '{show_name}', S{season:02}E{episode:02}")
+
+        # Try to match with next episodes
+        episode_match = None
+        matched_show = None
+
+        # First find matching shows using similarity
+        for show in self.matcher.matching_shows(show_name):
+            show_key = normalize_name(show["show"]["title"])
+            episode_match = self._find_wanted(show_key, parsed)
+            if episode_match:
+                episode = episode_match["episode"]
+                logger.info(f"Found matching episode: {episode_match['show_name']} S{season:02}E{episode:02}")
+                # Find the full show data from our collection
+                matched_show = self.show_by_key.get(show_key)
+                break
+
+        if not episode_match or not matched_show:
+            logger.info(f"No matching upcoming episode found for: {folder_name}")
+            if not delete_rejected:
+                logger.info(f"Leaving {root} for the full organizer")
+            elif root != self.unorganized_path:
+                logger.info(f"Removing unmatched folder: {root}")
+                self.fileops.delete_tree(root)
+            return False
+
+        # Construct destination path
+        show_folder = self._construct_show_folder_name(matched_show["show"])
+        season_folder = f"Season {season:02}"
+        dest_dir = os.path.join(self.media_path, show_folder, season_folder)
+        os.makedirs(dest_dir, exist_ok=True)
+
+        # Move each video file
+        for video_file in video_files:
+            source_path = os.path.join(root, video_file)
+            # Use the folder name as the final filename, but ensure it ends with .mkv
+            final_name = folder_name if folder_name.endswith('.mkv') else f"{folder_name}.mkv"
+            dest_path = os.path.join(dest_dir, final_name)
+
+            logger.info(f"Moving: {source_path} -> {dest_path}")
+            self.fileops.move(source_path, dest_path)
+
+        # Clean up source folder after moving files
+        if root != self.unorganized_path:
+            self.fileops.delete_tree(root)
+        return True
 
     def cleanup_library(self):
         """Remove files that don't match next episodes"""
-        for root, dirs, files in os.walk(self.media_path, topdown=False):
-            for file in files:
-                if not file.endswith((".mkv", ".mp4", ".avi")):
-                    continue
-
-                file_path = os.path.join(root, file)
-                if not self._is_needed_episode(file):
-                    print(f"Removing unneeded file: {file_path}")
+        with phase("library scan"):
+            self.library.refresh()
+        with phase("cleanup"):
+            for file_path in self.library.files():
+                if not self._is_needed_episode(os.path.basename(file_path)):
+                    logger.info(f"Removing unneeded file: {file_path}")
                     os.remove(file_path)
+                    self.library.forget_file(file_path)
 
             # Remove empty directories
-            if not os.listdir(root) and root != self.media_path:
-                self._force_delete_folder(root)
+            for root in self.library.directories():
+                if root != self.media_path and self.library.is_empty(root):
+                    self.fileops.delete_tree(root)
+                    self.library.forget_dir(root)
+            self.fileops.flush()
+        self.library.save()
 
     def _is_needed_episode(self, filename):
         """Check if file matches any next episodes"""
-        match = re.search(r"S(\d{2})E(\d{2})", filename)
-        if not match:
+        parsed = self._parse_episode_info(os.path.basename(filename))
+        if not parsed:
+            logger.debug(f"Could not extract show name from filename: {filename}")
             return False
 
-        season, episode = map(int, match.groups())
-        
-        # Extract show name from the filename itself
-        show_match = re.match(r"(.*?)\.S\d{2}E\d{2}", os.path.basename(filename))
-        if not show_match:
-            print(f"Could not extract show name from filename: {filename}")
-            return False
-            
-        show_name = show_match.group(1)
-        # Remove year if present
-        show_name = re.sub(r"\s*\(\d{4}\)|\.\d{4}", "", show_name)
-        # Replace dots with spaces
-        show_name = show_name.replace(".", " ").strip()
-
-        print(f"Extracted show: '{show_name}', S{season:02}E{episode:02}")
+        show_name, season, episode = parsed.show, parsed.season, parsed.episode
+
+        logger.debug(f"Extracted show: '{show_name}', S{season:02}E{episode:02}")
         
-        for next_ep in self.next_episodes:
-            trakt_show_name = next_ep["show_name"]
-            # Compare normalized names and episode numbers
-            if (normalize_name(trakt_show_name) == normalize_name(show_name) and
-                next_ep["season"] == season and
-                next_ep["episode"] == episode):
-                print(f"Found match: {filename} corresponds to {trakt_show_name} S{season:02}E{episode:02}")
-                return True
-                
-        print(f"No match found for: {os.path.basename(filename)}")
-        print(f"Looking for matches with show: '{show_name}', S{season:02}E{episode:02}")
-        print("Available next episodes:", [f"{ep['show_name']} S{ep['season']:02}E{ep['episode']:02}" 
-                                        for ep in self.next_episodes])
-        return False
+        # Compare normalized names and episode numbers
+        next_ep = self._find_wanted(normalize_name(show_name), parsed)
+        if next_ep:
+            logger.debug(f"Found match: {filename} corresponds to {next_ep['show_name']} S{next_ep['season']:02}E{next_ep['episode']:02}")
+            return True
 
-    def _force_delete_folder(self, folder_path):
-        """Forcefully remove a folder and all its contents"""
-        try:
-            # Use rm -rf to force delete folder and all contents
-            os.system(f"rm -rf '{folder_path}'")
-            print(f"Successfully deleted folder and contents: {folder_path}")
-        except Exception as e:
-            print(f"Error removing folder {folder_path}: {e}")
+        logger.debug(f"No match found for: {os.path.basename(filename)}")
+        return False
 
     def run(self):
         """Run the complete organization process"""
-        print("Starting organization process...")
-        print("Processing unorganized files...")
+        logger.info("Starting organization process...")
+        logger.info("Processing unorganized files...")
         self.organize_unorganized()
-        print("\nCleaning up library...")
+        logger.info("Cleaning up library...")
         self.cleanup_library()
-        print("Organization complete!")
+        logger.info("Organization complete!")
 
 
 if __name__ == "__main__":
+    setup_logging(settings['LOG_LEVEL'])
     organizer = VideoOrganizer()
     organizer.run()
+    log_summary()
@@ -0,0 +1,110 @@
+import math
+import time
+from release_parser import parse_release
+from utils import normalize_name, is_similar
+
+MB = 1024 * 1024
+DAY = 24 * 3600
+
+# Sensible single-episode sizes per resolution in MB, as (minimum, maximum)
+# Smaller releases are usually fakes or samples, larger ones waste bandwidth
+EPISODE_SIZES_MB = {
+    "480p": (100, 1000),
+    "576p": (100, 1200),
+    "720p": (200, 2500),
+    "1080p": (400, 5000),
+    "2160p": (1500, 15000),
+}
+
+# Weights of the score used to order releases of the same resolution
+SIMILARITY_WEIGHT = 3.0
+INDEXER_WEIGHT = 2.0
+SIZE_WEIGHT = 2.0
+AGE_WEIGHT = 1.0
+GRABS_WEIGHT = 0.5
+
+
+class Candidate:
+    """A release found on an indexer, with the parts of its ranking"""
+    __slots__ = ("result", "indexer", "resolution_rank", "similarity", "score")
+
+    def __init__(self, result, indexer, resolution_rank, similarity, score):
+        self.result = result
+        self.indexer = indexer
+        self.resolution_rank = resolution_rank
+        self.similarity = similarity
+        self.score = score
+
+    def __repr__(self):
+        return f"Candidate({self.result.title!r}, {self.indexer['name']}, {self.score:.2f})"
+
+
+def resolution_rank(title, resolutions):
+    """Return the preference index of the first configured resolution in title, or None"""
+    title = title.lower()
+    for rank, resolution in enumerate(resolutions):
+        if resolution.lower() in title:
+            return rank
+    return None
+
+
+def _size_score(size, resolution):
+    """1 inside the expected size range, falling towards 0 (or below) outside it"""
+    if not size or resolution not in EPISODE_SIZES_MB:
+        return 0.5
+    low, high = EPISODE_SIZES_MB[resolution]
+    size_mb = size / MB
+    if size_mb < low:
+        return size_mb / low - 1
+    if size_mb > high:
+        return high / size_mb
+    return 1.0
+
+
+def _age_score(pubdate, now):
+    """Prefer posts that have propagated but are well within retention"""
+    if not pubdate:
+        return 0.5
+    age_days = (now - pubdate) / DAY
+    if age_days < 1 / 24:
+        return 0.5
+    if age_days > 1500:
+        return 0.0
+    return 1.0 - age_days / 3000
+
+
+def rank_releases(show_name, season, episode, found, resolutions, indexer_count):
+    """
+    Rank every release found for an episode in a single pass
+    found is a list of (indexer_rank, indexer, results). Releases must contain
+    the episode, and match the show name and one of the configured resolutions.
+    They are ordered by resolution preference first, then by a score combining
+    name similarity, indexer priority, size, age and grabs. Returns Candidates,
+    best first.
+    """
+    now = time.time()
+    normalized_show = normalize_name(show_name)
+    candidates = []
+    for indexer_rank, indexer, results in found:
+        for result in results:
+            rank = resolution_rank(result.title, resolutions)
+            if rank is None:
+                continue
+            parsed = parse_release(result.title)
+            if not parsed or not parsed.covers(season, episode):
+                continue
+            similar, similarity = is_similar(normalized_show, normalize_name(parsed.show))
+            if not similar:
+                continue
+
+            score = (
+                SIMILARITY_WEIGHT * (similarity - 0.8) / 0.2
+                + INDEXER_WEIGHT * (1 - indexer_rank / max(indexer_count, 1))
+                + SIZE_WEIGHT * _size_score(result.size, resolutions[rank])
+                + AGE_WEIGHT * _age_score(result.pubdate, now)
+                + GRABS_WEIGHT * math.log10(1 + (result.grabs or 0)) / 3
+            )
+            candidates.append(Candidate(result, indexer, rank, similarity, score))
+
+    candidates.sort(key=lambda c: (c.resolution_rank, -c.score))
+    return candidates
@@ -0,0 +1,121 @@
+import re
+from functools import lru_cache
+
+_EXTENSION = re.compile(r"\.(?:nzb|mkv|mp4|avi)$", re.IGNORECASE)
+
+# Show.Name.S01E02, S01E02E03, S01E02-E03 and S01E02-03
+_SEASON_EPISODE = re.compile(
+    r"^(?P<show>.+?)[\s._-]+S(?P<season>\d{1,2})[\s._-]?"
+    r"E(?P<episode>\d{2,3})(?P<more>(?:[\s._]?E\d{2,3})*)(?:-E?(?P<last>\d{2,3})\b)?",
+    re.IGNORECASE,
+)
+# Show.Name.1x02
+_CROSS = re.compile(r"^(?P<show>.+?)[\s._-]+(?P<season>\d{1,2})x(?P<episode>\d{2,3})\b", re.IGNORECASE)
+# Show.Name.2024.01.15 for daily shows
+_DAILY = re.compile(
+    r"^(?P<show>.+?)[\s._-]+(?P<date>(?:19|20)\d{2}[\s._-]\d{2}[\s._-]\d{2})\b"
+)
+_DATE_SEPARATOR = re.compile(r"[\s._-]")
+_MORE_EPISODES = re.compile(r"E(\d{2,3})", re.IGNORECASE)
+_YEAR = re.compile(r"[\s._-]*\(?((?:19|20)\d{2})\)?$")
+_SEPARATORS = re.compile(r"[\s._]+")
+_RESOLUTION = re.compile(r"\b(2160p|1080p|720p|576p|480p)\b", re.IGNORECASE)
+_SOURCE = re.compile(
+    r"\b(WEB-DL|WEBRip|WEB|HDTV|BluRay|BDRip|BRRip|DVDRip|HDRip)\b", re.IGNORECASE
+)
+_GROUP = re.compile(r"-(\w+)$")
+
+
+class ParsedRelease:
+    """Structured fields of a release, file or folder name"""
+    __slots__ = ("name", "show", "year", "season", "episodes", "air_date",
+                 "resolution", "source", "group")
+
+    def __init__(self, name, show, year=None, season=None, episodes=(), air_date=None,
+                 resolution=None, source=None, group=None):
+        self.name = name
+        self.show = show
+        self.year = year
+        self.season = season
+        self.episodes = episodes
+        self.air_date = air_date
+        self.resolution = resolution
+        self.source = source
+        self.group = group
+
+    @property
+    def episode(self):
+        """The first episode, or None for daily releases"""
+        return self.episodes[0] if self.episodes else None
+
+    def covers(self, season, episode):
+        """Check whether the release contains the given episode"""
+        return self.season == season and episode in self.episodes
+
+    def __repr__(self):
+        if self.air_date:
+            return f"ParsedRelease({self.show!r}, {self.air_date})"
+        numbers = "".join(f"E{episode:02}" for episode in self.episodes)
+        return f"ParsedRelease({self.show!r}, S{self.season:02}{numbers})"
+
+
+def _clean_show(raw):
+    """Turn the show part of a name into a title and a year"""
+    raw = _SEPARATORS.sub(" ", raw).strip(" -")
+    year = None
+    match = _YEAR.search(raw)
+    # Keep titles that are only a year, such as "1923"
+    if match and match.start() > 0:
+        year = int(match.group(1))
+        raw = raw[:match.start()]
+    return raw.strip(" -"), year
+
+
+@lru_cache(maxsize=4096)
+def parse_release(name):
+    """
+    Parse a release, file or folder name into a ParsedRelease
+    Handles SxxEyy (including multi-episode SxxEyyEzz and SxxEyy-zz), NxNN
+    and daily YYYY.MM.DD names. Returns None when no episode can be found.
+    """
+    base = _EXTENSION.sub("", name)
+
+    season, episodes, air_date = None, (), None
+    match = _SEASON_EPISODE.search(base)
+    if match:
+        season = int(match.group("season"))
+        first = int(match.group("episode"))
+        episodes = [first] + [int(e) for e in _MORE_EPISODES.findall(match.group("more"))]
+        if match.group("last"):
+            episodes += range(episodes[-1] + 1, int(match.group("last")) + 1)
+        episodes = tuple(episodes)
+    else:
+        match = _CROSS.search(base)
+        if match:
+            season = int(match.group("season"))
+            episodes = (int(match.group("episode")),)
+        else:
+            match = _DAILY.search(base)
+            if not match:
+                return None
+            air_date = "-".join(_DATE_SEPARATOR.split(match.group("date")))
+
+    show, year = _clean_show(match.group("show"))
+    if not show:
+        return None
+
+    tail = base[match.end():]
+    resolution = _RESOLUTION.search(tail)
+    source = _SOURCE.search(tail)
+    group = _GROUP.search(tail)
+    return ParsedRelease(
+        name,
+        show,
+        year=year,
+        season=season,
+        episodes=episodes,
+        air_date=air_date,
+        resolution=resolution.group(1).lower() if resolution else None,
+        source=source.group(1) if source else None,
+        group=group.group(1) if group else None,
+    )
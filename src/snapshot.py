@@ -0,0 +1,65 @@
+import json
+import logging
+import os
+import time
+from config import settings
+from state_file import write_json
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def _snapshot_path():
+    return os.path.join(settings["DATA_PATH"], "wanted_snapshot.json")
+
+
+def save_wanted_snapshot(shows, next_episodes):
+    """
+    Persist the collection and each show's next episodes for other processes
+    shows are collection entries, next_episodes maps Trakt show ids to the
+    episode lists returned by get_last_watched_and_next_episodes
+    """
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "created_at": time.time(),
+        # Only the show records are needed, not the collected episode lists
+        "shows": [{"show": show["show"]} for show in shows],
+        "next_episodes": {str(show_id): eps for show_id, eps in next_episodes.items()},
+    }
+    if write_json(_snapshot_path(), snapshot):
+        logger.info(f"Saved wanted snapshot with {len(snapshot['shows'])} shows")
+
+
+def read_wanted_snapshot():
+    """Return the saved snapshot whatever its age, or None when it is missing or unreadable"""
+    try:
+        with open(_snapshot_path(), "r") as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable wanted snapshot: {e}")
+        return None
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+def load_wanted_snapshot(max_age=None):
+    """
+    Load the wanted snapshot if it exists and is at most max_age seconds old
+    Returns (shows, next_episodes) or None when it is missing, stale or unreadable
+    """
+    if max_age is None:
+        max_age = settings["WANTED_SNAPSHOT_MAX_AGE"]
+    snapshot = read_wanted_snapshot()
+    if snapshot is None:
+        return None
+    age = time.time() - snapshot.get("created_at", 0)
+    if age > max_age:
+        logger.info(f"Wanted snapshot is stale ({age / 60:.0f} minutes old)")
+        return None
+
+    logger.info(f"Using wanted snapshot from {age / 60:.0f} minutes ago")
+    return snapshot["shows"], snapshot["next_episodes"]
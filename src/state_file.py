@@ -0,0 +1,32 @@
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+def write_json(path, data):
+    """
+    Replace the JSON file at path atomically, returning False if it failed
+    Every writer gets its own temporary file, so processes saving the same
+    state at once can't interleave their writes. Failing is not fatal: the
+    state is rebuilt or fetched again by the next run.
+    """
+    directory = os.path.dirname(path)
+    tmp_path = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        return True
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Could not save {path}: {e}")
+        if tmp_path:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return False
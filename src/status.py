@@ -0,0 +1,88 @@
+import json
+import os
+import time
+from config import settings
+from snapshot import read_wanted_snapshot
+
+DAY = 24 * 3600
+
+
+def _ago(timestamp):
+    minutes = (time.time() - timestamp) / 60
+    if minutes < 120:
+        return f"{minutes:.0f} minutes ago"
+    return f"{minutes / 60:.1f} hours ago"
+
+
+def _folder_status(path):
+    try:
+        with os.scandir(path) as entries:
+            count = sum(1 for _ in entries)
+    except FileNotFoundError:
+        return f"{path} (missing)"
+    except OSError as e:
+        return f"{path} ({e})"
+    return f"{path} ({count} entries)"
+
+
+def _sync_status(path):
+    try:
+        with open(path, "r") as f:
+            shows = json.load(f).get("shows", {})
+    except FileNotFoundError:
+        return "never run"
+    except (OSError, ValueError, AttributeError) as e:
+        return f"unreadable ({e})"
+    computed = [entry.get("computed_at", 0) for entry in shows.values()]
+    if not computed:
+        return "no shows yet"
+    return f"{len(shows)} shows, last refreshed {_ago(max(computed))}"
+
+
+def _grab_status(path):
+    if not os.path.exists(path):
+        return "no grabs yet"
+    # Imported here so status stays cheap when there is no history
+    from grab_history import GrabHistory
+    history = GrabHistory(path, settings["GRAB_REGRAB_AFTER"],
+                          settings["GRAB_RETRY_BASE"], settings["GRAB_RETRY_MAX"])
+    try:
+        summary = history.summary(time.time() - DAY)
+    finally:
+        history.close()
+    return (f"{summary['sent']} sent in the last 24 hours, {summary['blocked']} blocklisted, "
+            f"{summary['backing_off']} episodes waiting to be searched again")
+
+
+def report():
+    """
+    Print the configuration and the state Traktarr keeps between runs
+    Only local files are read, nothing is fetched. Returns False if settings
+    the downloader needs are missing.
+    """
+    data_path = settings["DATA_PATH"]
+    missing_trakt = settings.missing("trakt")
+    missing_nzbget = settings.missing("nzbget")
+    indexers = settings.enabled_indexers()
+
+    lines = [
+        f"Trakt:        {'missing ' + ', '.join(missing_trakt) if missing_trakt else 'configured'}",
+        f"NZBGet:       {'missing ' + ', '.join(missing_nzbget) if missing_nzbget else settings['NZBGET_URL']}",
+        f"Indexers:     {', '.join(idx['name'] for idx in indexers) or 'none enabled with an API key'}",
+        f"Library:      {_folder_status(settings['MEDIA_LIBRARY_TV_SHOWS_PATH'])}",
+        f"Unorganized:  {_folder_status(settings['UNORGANIZED_TV_SHOWS_PATH'])}",
+        f"Data:         {data_path}",
+    ]
+
+    snapshot = read_wanted_snapshot()
+    if snapshot:
+        wanted = sum(len(episodes or []) for episodes in snapshot["next_episodes"].values())
+        lines.append(f"Wanted:       {wanted} episodes of {len(snapshot['shows'])} shows, "
+                     f"saved {_ago(snapshot['created_at'])}")
+    else:
+        lines.append("Wanted:       no snapshot, the downloader has not run yet")
+    lines.append(f"Trakt sync:   {_sync_status(os.path.join(data_path, 'trakt_sync.json'))}")
+    lines.append(f"Grabs:        {_grab_status(os.path.join(data_path, 'grab_history.sqlite'))}")
+
+    print("\n".join(lines))
+    return not (missing_trakt or missing_nzbget or not indexers)
@@ -2,17 +2,16 @@ import requests
 import time
 from config import settings
 
-# Configuration
-TRAKT_CLIENT_ID = settings["TRAKT_CLIENT_ID"]
-TRAKT_CLIENT_SECRET = settings["TRAKT_CLIENT_SECRET"]
-BASE_URL = "https://api.trakt.tv"
+
+def _base_url():
+    return settings["TRAKT_API_URL"].rstrip("/")
 
 
 # Step 1: Request Device Code and User Code
 def get_device_code():
-    url = f"{BASE_URL}/oauth/device/code"
-    headers = {"Content-Type": "application/json", "trakt-api-key": TRAKT_CLIENT_ID}
-    payload = {"client_id": TRAKT_CLIENT_ID}
+    url = f"{_base_url()}/oauth/device/code"
+    headers = {"Content-Type": "application/json", "trakt-api-key": settings["TRAKT_CLIENT_ID"]}
+    payload = {"client_id": settings["TRAKT_CLIENT_ID"]}
 
     response = requests.post(url, headers=headers, json=payload)
     if response.status_code == 200:
@@ -25,12 +24,12 @@ def get_device_code():
 
 # Step 2: Poll for Access Token
 def poll_for_access_token(device_code):
-    url = f"{BASE_URL}/oauth/device/token"
+    url = f"{_base_url()}/oauth/device/token"
     headers = {"Content-Type": "application/json"}
     payload = {
         "code": device_code,
-        "client_id": TRAKT_CLIENT_ID,
-        "client_secret": TRAKT_CLIENT_SECRET,
+        "client_id": settings["TRAKT_CLIENT_ID"],
+        "client_secret": settings["TRAKT_CLIENT_SECRET"],
     }
 
     while True:
@@ -56,14 +55,17 @@ def poll_for_access_token(device_code):
     return None
 
 
-if __name__ == "__main__":
+def authorize():
+    """Walk the user through Trakt's device authorization, returning True on success"""
+    settings.require("authorize")
+
     # Step 1: Get Device Code and User Code
     print("Requesting device code...")
     device_code_data = get_device_code()
 
     if not device_code_data:
         print("Failed to retrieve device code. Exiting.")
-        exit(1)
+        return False
 
     device_code = device_code_data["device_code"]
     user_code = device_code_data["user_code"]
@@ -82,5 +84,11 @@ if __name__ == "__main__":
         print("\nAuthorization successful!")
         print("\nIMPORTANT: Update your settings.local.yaml with the following value:")
         print(f'\nTRAKT_ACCESS_TOKEN: "{access_token_data["access_token"]}"')
-    else:
-        print("\nFailed to retrieve access token. Exiting.")
+        return True
+    print("\nFailed to retrieve access token. Exiting.")
+    return False
+
+
+if __name__ == "__main__":
+    if not authorize():
+        exit(1)
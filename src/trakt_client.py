@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+from cache import SQLiteCache
+from config import settings
+from instrumentation import instrument_session
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = "https://api.trakt.tv"
+
+# Statuses worth retrying: rate limiting, server errors and Cloudflare origin errors
+RETRY_STATUSES = {429, 500, 502, 503, 504, 520, 521, 522, 524}
+MAX_RETRY_DELAY = 60
+
+# Start spacing requests out once less than this share of the rate limit is left
+THROTTLE_THRESHOLD = 0.1
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Cache lifetimes per endpoint as (path pattern, TTL for 200, TTL for 404)
+# Anything else is stored with a zero TTL: it is always revalidated with its
+# ETag, but can still be served when Trakt is unreachable
+CACHE_TTLS = [
+    (re.compile(r"^/shows/[^/]+$"), 7 * DAY, DAY),
+    (re.compile(r"^/shows/[^/]+/seasons/\d+/episodes/\d+$"), 7 * DAY, 6 * HOUR),
+]
+
+
+def cache_ttl(path, status_code):
+    """Return how long a response for path stays fresh"""
+    for pattern, ok_ttl, missing_ttl in CACHE_TTLS:
+        if pattern.match(path):
+            return ok_ttl if status_code == 200 else missing_ttl
+    return 0
+
+
+class CachedResponse:
+    """Minimal stand-in for a requests.Response served from the cache"""
+    def __init__(self, status_code, text, url):
+        self.status_code = status_code
+        self.text = text
+        self.url = url
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+class TraktClient:
+    """
+    Trakt API client with a pooled session, timeouts, retries with jittered
+    backoff, and throttling driven by Trakt's rate-limit headers
+    """
+    def __init__(self, client_id, access_token, base_url=BASE_URL,
+                 timeout=10, max_retries=4, backoff=1.0, cache=None):
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = instrument_session(requests.Session())
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=8)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {access_token}",
+            "trakt-api-version": "2",
+            "trakt-api-key": client_id,
+        })
+        self._lock = threading.Lock()
+        self._next_request_at = 0.0
+
+    def _throttle(self):
+        """Wait until the rate limit allows another request"""
+        with self._lock:
+            delay = self._next_request_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _update_rate_limit(self, response):
+        """Space out upcoming requests when the X-Ratelimit budget runs low"""
+        header = response.headers.get("X-Ratelimit")
+        if not header:
+            return
+        try:
+            limit = json.loads(header)
+            remaining = int(limit["remaining"])
+            total = int(limit["limit"])
+            period = float(limit.get("period", 300))
+            until = datetime.fromisoformat(limit["until"].replace("Z", "+00:00"))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return
+
+        window = min(max(0.0, until.timestamp() - time.time()), period)
+        if remaining <= 0:
+            delay = window
+        elif remaining < total * THROTTLE_THRESHOLD:
+            delay = window / remaining
+        else:
+            return
+        with self._lock:
+            self._next_request_at = max(self._next_request_at, time.monotonic() + delay)
+
+    def _retry_delay(self, attempt, response=None):
+        """Honour Retry-After when given, otherwise use full-jitter exponential backoff"""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), MAX_RETRY_DELAY) + random.uniform(0, self.backoff)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff * 2 ** attempt, MAX_RETRY_DELAY))
+
+    def request(self, method, path, **kwargs):
+        """
+        Send a request, retrying rate-limited, failed and timed out attempts
+        Returns the final response without raising for its status
+        """
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self._throttle()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning(f"Trakt request failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self._update_rate_limit(response)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            delay = self._retry_delay(attempt, response)
+            logger.warning(f"Trakt returned {response.status_code} for {path}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def get(self, path, params=None):
+        """
+        GET a Trakt endpoint, returning the response
+        With a cache, fresh entries are served locally, stale ones are revalidated
+        with If-None-Match, and any stored entry is used when Trakt is unreachable
+        """
+        if self.cache is None:
+            return self.request("GET", path, params=params)
+
+        key = path
+        if params:
+            key += "?" + "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+        entry = self.cache.get(key)
+        if entry is not None:
+            status_code, text = json.loads(entry.value)
+            cached = CachedResponse(status_code, text, key)
+            if entry.fresh:
+                return cached
+
+        headers = {"If-None-Match": entry.etag} if entry is not None and entry.etag else None
+        try:
+            response = self.request("GET", path, params=params, headers=headers)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if entry is None:
+                raise
+            logger.warning(f"Trakt unreachable ({e}), using cached {key}")
+            return cached
+
+        if entry is not None:
+            if response.status_code == 304:
+                self.cache.touch(key, cache_ttl(path, status_code))
+                return cached
+            if response.status_code >= 500:
+                logger.warning(f"Trakt returned {response.status_code}, using cached {key}")
+                return cached
+
+        if response.status_code in (200, 404):
+            self.cache.set(
+                key,
+                json.dumps([response.status_code, response.text]),
+                cache_ttl(path, response.status_code),
+                etag=response.headers.get("ETag"),
+            )
+        return response
+
+    def get_json(self, path, params=None):
+        """GET a Trakt endpoint and return its decoded JSON, raising on HTTP errors"""
+        response = self.get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+
+_client = None
+
+
+def get_client():
+    """Return the shared TraktClient, creating it on first use"""
+    global _client
+    if _client is None:
+        settings.require("trakt")
+        cache = None
+        if settings["TRAKT_CACHE_ENABLED"]:
+            cache = SQLiteCache(
+                os.path.join(settings["DATA_PATH"], "trakt_cache.sqlite"),
+                max_entries=settings["TRAKT_CACHE_MAX_ENTRIES"],
+            )
+        _client = TraktClient(
+            settings["TRAKT_CLIENT_ID"],
+            settings["TRAKT_ACCESS_TOKEN"],
+            base_url=settings["TRAKT_API_URL"],
+            timeout=settings["TRAKT_REQUEST_TIMEOUT"],
+            max_retries=settings["TRAKT_MAX_RETRIES"],
+            cache=cache,
+        )
+    return _client
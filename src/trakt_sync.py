@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+import time
+from config import settings
+from state_file import write_json
+from trakt_client import get_client
+from utils import get_last_watched_and_next_episodes
+
+logger = logging.getLogger(__name__)
+
+SYNC_STATE_VERSION = 1
+
+
+class IncrementalSync:
+    """
+    Reuses each show's next episodes until its Trakt state changes
+    /sync/last_activities is checked once per run. Only when the account's
+    watch watermark moved is /sync/watched/shows fetched to see which shows
+    were watched; collection changes come from the collection payload itself.
+    Shows that changed, have room for newly aired episodes, or were computed
+    more than INCREMENTAL_SYNC_MAX_AGE seconds ago are recomputed.
+    """
+    def __init__(self, path=None):
+        self.path = path or os.path.join(settings["DATA_PATH"], "trakt_sync.json")
+        self.enabled = settings["INCREMENTAL_SYNC"]
+        self.max_age = settings["INCREMENTAL_SYNC_MAX_AGE"]
+        self.count = settings["NEXT_EPISODES_COUNT"]
+        self._state = None
+        self._watched_at = {}
+        self._refresh_all = False
+
+    def _load(self):
+        self._state = {"version": SYNC_STATE_VERSION, "watched_at": None, "shows": {}}
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable sync state: {e}")
+            return
+        if state.get("version") == SYNC_STATE_VERSION:
+            self._state = state
+
+    def save(self):
+        if not self.enabled or self._state is None:
+            return
+        write_json(self.path, self._state)
+
+    def begin(self):
+        """Check Trakt's last activities before a run"""
+        if not self.enabled:
+            return
+        if self._state is None:
+            self._load()
+
+        try:
+            activities = get_client().get_json("/sync/last_activities")
+            watched_at = activities.get("episodes", {}).get("watched_at")
+            if watched_at != self._state["watched_at"]:
+                logger.debug("Trakt watch history changed, checking which shows were watched")
+                watched = get_client().get_json(
+                    "/sync/watched/shows", params={"extended": "noseasons"}
+                )
+                self._watched_at = {
+                    str(item["show"]["ids"]["trakt"]): item.get("last_watched_at")
+                    for item in watched
+                }
+                self._state["watched_at"] = watched_at
+            else:
+                self._watched_at = {
+                    show_id: entry.get("last_watched_at")
+                    for show_id, entry in self._state["shows"].items()
+                }
+            self._refresh_all = False
+        except Exception as e:
+            logger.warning(f"Could not check Trakt last activities ({e}), refreshing every show")
+            self._refresh_all = True
+
+    def _is_current(self, show, entry):
+        """Check whether a stored result still holds for show"""
+        show_id = str(show["show"]["ids"]["trakt"])
+        return (
+            not self._refresh_all
+            and entry.get("count") == self.count
+            # A show with room to spare may have new episodes aired since
+            and len(entry["next_episodes"]) >= self.count
+            and time.time() - entry["computed_at"] <= self.max_age
+            and entry.get("last_watched_at") == self._watched_at.get(show_id)
+            and entry.get("last_collected_at") == show.get("last_collected_at")
+        )
+
+    def next_episodes(self, show, verbose=False):
+        """Return (last_watched, next_episodes) for a collection entry"""
+        show_id = show["show"]["ids"]["trakt"]
+        if not self.enabled:
+            return get_last_watched_and_next_episodes(show_id, verbose=verbose)
+        if self._state is None:
+            self.begin()
+
+        entry = self._state["shows"].get(str(show_id))
+        if entry and self._is_current(show, entry):
+            if verbose:
+                logger.debug("Unchanged since last sync, reusing next episodes")
+            return entry["last_watched"], entry["next_episodes"]
+
+        last_watched, next_eps = get_last_watched_and_next_episodes(show_id, verbose=verbose)
+        self._state["shows"][str(show_id)] = {
+            "last_watched": last_watched,
+            "next_episodes": next_eps or [],
+            "count": self.count,
+            "computed_at": time.time(),
+            "last_watched_at": self._watched_at.get(str(show_id)),
+            "last_collected_at": show.get("last_collected_at"),
+        }
+        return last_watched, next_eps
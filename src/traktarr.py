@@ -0,0 +1,81 @@
+import argparse
+import sys
+
+# Exit status of organize-one when the download held no wanted episode
+NOTHING_ORGANIZED = 3
+
+
+def download(args):
+    from downloader import ShowDownloader
+    ShowDownloader().run()
+
+
+def organize(args):
+    from organizer import VideoOrganizer
+    VideoOrganizer().run()
+
+
+def organize_one(args):
+    from organizer import VideoOrganizer
+    # Any saved wanted list will do, a finished download should not wait on Trakt
+    organizer = VideoOrganizer(snapshot_max_age=float("inf"))
+    if not organizer.organize_one(args.path):
+        sys.exit(NOTHING_ORGANIZED)
+
+
+def authorize(args):
+    from trakt_authorizer import authorize
+    if not authorize():
+        sys.exit(1)
+
+
+def status(args):
+    from status import report
+    if not report():
+        sys.exit(1)
+
+
+def watch(args):
+    from watcher import FolderWatcher
+    FolderWatcher().run()
+
+
+def daemon(args):
+    from daemon import Daemon
+    Daemon().run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="traktarr", description="Trakt-based TV show automation")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], type=str.upper,
+                        help="override the LOG_LEVEL setting")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="profile the run with cProfile and write pstats data to PATH")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("download", help="download the next episodes of collected shows").set_defaults(func=download)
+    commands.add_parser("organize", help="move finished downloads into the library and clean it up").set_defaults(func=organize)
+    one = commands.add_parser("organize-one", help="organize a single finished download, e.g. from NZBGet")
+    one.add_argument("path", help="download directory inside the unorganized path")
+    one.set_defaults(func=organize_one)
+    commands.add_parser("authorize", help="get a Trakt access token for TRAKT_ACCESS_TOKEN").set_defaults(
+        func=authorize, summary=False)
+    commands.add_parser("status", help="show the configuration and the state kept between runs").set_defaults(
+        func=status, summary=False)
+    commands.add_parser("watch", help="organize downloads as they appear in the unorganized path").set_defaults(func=watch)
+    commands.add_parser("daemon", help="keep running and download and organize on a schedule").set_defaults(func=daemon)
+
+    args = parser.parse_args(argv)
+    # Subsystems are imported by each command, so e.g. status never loads requests
+    from config import settings
+    from instrumentation import log_summary, profiled, setup_logging
+    setup_logging(args.log_level or settings["LOG_LEVEL"])
+    with profiled(args.profile):
+        try:
+            args.func(args)
+        finally:
+            if getattr(args, "summary", True):
+                log_summary()
+
+
+if __name__ == "__main__":
+    main()
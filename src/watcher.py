@@ -0,0 +1,292 @@
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import signal
+import struct
+import threading
+import time
+from config import settings
+from organizer import VideoOrganizer
+from state_file import write_json
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+WATCH_MASK = IN_CREATE | IN_MOVED_TO | IN_CLOSE_WRITE | IN_ATTRIB | IN_MODIFY | IN_DELETE_SELF | IN_MOVE_SELF
+
+
+class InotifyWatcher:
+    """
+    Reports the names of entries created or changed directly inside a folder
+    wakeup_fd, if given, ends a wait early when it becomes readable
+    """
+    def __init__(self, path, wakeup_fd=None):
+        self.wakeup_fd = wakeup_fd
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {path}")
+
+    def wait(self, timeout):
+        """
+        Wait up to timeout seconds (None for no limit) for changes
+        Returns the changed names, or None when everything must be rescanned
+        """
+        fds = [self.fd] if self.wakeup_fd is None else [self.fd, self.wakeup_fd]
+        readable, _, _ = select.select(fds, [], [], timeout)
+        if self.wakeup_fd in readable:
+            try:
+                os.read(self.wakeup_fd, 512)
+            except BlockingIOError:
+                pass
+        if self.fd not in readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        names = set()
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & (IN_Q_OVERFLOW | IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                return None
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Finds new or changed entries of a folder by comparing mtimes every interval"""
+    def __init__(self, path, interval, stop_event):
+        self.path = path
+        self.interval = interval
+        self.stop_event = stop_event
+        self._mtimes = self._scan()
+
+    def _scan(self):
+        mtimes = {}
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    try:
+                        mtimes[entry.name] = entry.stat(follow_symlinks=False).st_mtime_ns
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.error(f"Error scanning {self.path}: {e}")
+        return mtimes
+
+    def wait(self, timeout):
+        if self.stop_event.wait(self.interval if timeout is None else min(timeout, self.interval)):
+            return set()
+        mtimes = self._scan()
+        changed = {name for name, mtime in mtimes.items() if self._mtimes.get(name) != mtime}
+        self._mtimes = mtimes
+        return changed
+
+    def close(self):
+        pass
+
+
+class OrganizeJournal:
+    """
+    Remembers which download folders were already organized or rejected
+    Entries are keyed by folder name and mtime, so a folder is only looked at
+    again once its contents change
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable organize journal: {e}")
+
+    def seen(self, name, mtime):
+        entry = self.entries.get(name)
+        return entry is not None and entry["mtime"] == mtime
+
+    def record(self, name, mtime, outcome):
+        self.entries[name] = {"mtime": mtime, "outcome": outcome, "at": time.time()}
+
+    def prune(self, names):
+        """Forget folders that no longer exist"""
+        self.entries = {name: entry for name, entry in self.entries.items() if name in names}
+
+    def save(self):
+        write_json(self.path, self.entries)
+
+
+def _signature(path):
+    """Summarize a folder's contents to tell when a download has stopped changing"""
+    count = size = latest = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            count += 1
+            size += stat.st_size
+            latest = max(latest, stat.st_mtime_ns)
+    return count, size, latest
+
+
+class FolderWatcher:
+    """
+    Organizes download folders as they appear in the unorganized folder
+    Uses inotify where available and falls back to polling otherwise. Only
+    the top level of UNORGANIZED_TV_SHOWS_PATH is watched; a new or changed
+    folder is organized once its contents have not changed for
+    WATCH_SETTLE_SECONDS. Organized and rejected folders go into a journal
+    so they are not parsed and matched again until they change.
+    """
+    def __init__(self):
+        self.path = settings["UNORGANIZED_TV_SHOWS_PATH"]
+        self.settle = settings["WATCH_SETTLE_SECONDS"]
+        self.poll_interval = settings["WATCH_POLL_INTERVAL"]
+        self.journal = OrganizeJournal(os.path.join(settings["DATA_PATH"], "organize_journal.json"))
+        self.organizer = None
+        self.watcher = None
+        # Folder name -> (signature, time it was last seen changing)
+        self._pending = {}
+        self._stop = threading.Event()
+        self._wakeup_r = None
+
+    def _open_watcher(self):
+        if settings["WATCH_USE_INOTIFY"]:
+            try:
+                watcher = InotifyWatcher(self.path, self._wakeup_r)
+                logger.info(f"Watching {self.path} with inotify")
+                return watcher
+            except (OSError, AttributeError) as e:
+                logger.warning(f"inotify unavailable ({e}), falling back to polling")
+        logger.info(f"Polling {self.path} every {self.poll_interval}s")
+        return PollingWatcher(self.path, self.poll_interval, self._stop)
+
+    def _mtime(self, name):
+        try:
+            return os.stat(os.path.join(self.path, name)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _queue(self, names):
+        for name in names:
+            if name not in self._pending and os.path.isdir(os.path.join(self.path, name)):
+                self._pending[name] = (None, time.monotonic())
+
+    def _rescan(self):
+        """Queue every folder not already in the journal"""
+        try:
+            names = set(os.listdir(self.path))
+        except OSError as e:
+            logger.error(f"Error listing {self.path}: {e}")
+            return
+        self.journal.prune(names)
+        self._queue(name for name in names if not self.journal.seen(name, self._mtime(name)))
+
+    def _settled(self):
+        """Return pending folders whose contents stopped changing"""
+        now = time.monotonic()
+        ready = []
+        for name, (signature, since) in list(self._pending.items()):
+            path = os.path.join(self.path, name)
+            if not os.path.isdir(path):
+                del self._pending[name]
+                continue
+            current = _signature(path)
+            if current != signature:
+                self._pending[name] = (current, now)
+            elif now - since >= self.settle:
+                del self._pending[name]
+                ready.append(name)
+        return ready
+
+    def _organize(self, names):
+        if self.organizer is None:
+            self.organizer = VideoOrganizer()
+        else:
+            self.organizer.load_wanted()
+        for name in names:
+            mtime = self._mtime(name)
+            if self.journal.seen(name, mtime):
+                continue
+            try:
+                moved = self.organizer.organize_one(os.path.join(self.path, name))
+            except Exception:
+                logger.exception(f"Error organizing {name}")
+                continue
+            # Folders are normally deleted once handled; remember any left behind
+            mtime = self._mtime(name)
+            if mtime is not None:
+                self.journal.record(name, mtime, "organized" if moved else "rejected")
+        self.journal.save()
+
+    def stop(self, signum=None, frame=None):
+        self._stop.set()
+
+    def run(self):
+        """Watch and organize until stopped"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        # Signals write to this pipe so a blocking inotify wait returns at once
+        self._wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(wakeup_w, False)
+        signal.set_wakeup_fd(wakeup_w)
+        self.watcher = self._open_watcher()
+        self._rescan()
+        try:
+            while not self._stop.is_set():
+                timeout = min(self.settle / 2, self.poll_interval) if self._pending else None
+                try:
+                    names = self.watcher.wait(timeout)
+                except InterruptedError:
+                    continue
+                if names is None:
+                    logger.warning("Watch queue overflowed or folder moved, rescanning")
+                    self.watcher.close()
+                    self.watcher = self._open_watcher()
+                    self._rescan()
+                else:
+                    self._queue(names)
+
+                ready = self._settled()
+                if ready:
+                    self._organize(ready)
+        finally:
+            self.watcher.close()
+            signal.set_wakeup_fd(-1)
+            os.close(self._wakeup_r)
+            os.close(wakeup_w)
+            logger.info("Watcher stopped")